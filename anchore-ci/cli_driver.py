@@ -1,19 +1,34 @@
 #!/usr/bin/env python
 
+import argparse
+import atexit
+import codecs
+import collections
+from collections import namedtuple
+import concurrent.futures
 import copy
-from distutils.util import strtobool
-from dotenv import load_dotenv
+import hashlib
 import json
 import logging
+import logging.handlers
 import time
 import os
+import queue
 import random
 import subprocess
 import sys
+import threading
 
 import cli_driver_config as config
-
-from faker import Faker
+import cli_driver_profile
+import cli_driver_reports
+from cli_driver_transport import (
+    make_transport,
+    split_command,
+    CommandTimeout,
+    RecordingTransport,
+    ReplayTransport,
+)
 
 
 def assemble_command(context, args):
@@ -24,90 +39,1155 @@ def assemble_command(context, args):
     return command
 
 
+def run_command(command, cached=False, retry=True, timed=True):
+    """Run an assembled anchore-cli command through the configured transport.
+
+    Returns a CompletedProcess and raises CalledProcessError on failure, whichever
+    transport is in use. Successful read-only commands are remembered in the
+    response cache; pass cached=True to be served from it when possible (only
+    for helpers that do not themselves test the command). Pass retry=False to
+    run it once, bypassing retries and the circuit breaker: for probes and
+    pollers, which poll again on their own schedule and expect failures while
+    the engine is starting. Pass timed=False to leave it out of command_stats
+    (background traffic that would skew the timings of the checks).
+    """
+    argv = command.split()
+    key, family, kind = classify_command(argv)
+    if cached:
+        hit = response_cache.get(key)
+        if hit is not None:
+            logger.debug("run_command | cache hit: %s", " ".join(key[2]))
+            command_stats.record_cache_hit(key[2])
+            return hit
+    started = time.time()
+    result_state.user = key[1]
+    try:
+        if retry:
+            completed_proc = run_with_retries(argv, key, kind)
+        else:
+            completed_proc = transport.run(argv, command_timeout(key[2]))
+    except CommandTimeout as e:
+        elapsed = time.time() - started
+        if timed:
+            command_stats.record(key[2], elapsed, e, error=True)
+        logger.warning(
+            "run_command | {0} timed out after {1:.1f}s; killed it".format(
+                command_signature(key[2]), elapsed
+            )
+        )
+        result_state.error = "timed out after {0:.1f}s".format(elapsed)
+        result_state.timed_out = True
+        raise
+    except Exception as e:
+        if timed:
+            command_stats.record(key[2], time.time() - started, e, error=True)
+        result_state.error = str(getattr(e, "stderr", None) or e).strip()
+        raise
+    finally:
+        if kind == "write":
+            response_cache.invalidate(family)
+    if timed:
+        command_stats.record(key[2], time.time() - started, completed_proc)
+    if kind == "read":
+        response_cache.put(key, family, completed_proc)
+    return completed_proc
+
+
+class EngineUnavailable(Exception):
+    """Raised instead of running a command while the circuit breaker for its
+    engine is open."""
+
+
+class CircuitBreaker:
+    """Stop sending commands to an engine that keeps failing transiently.
+
+    After threshold retryable failures in a row against one api_url, commands
+    against it fail fast with EngineUnavailable for reset_timeout seconds. Then
+    one command is let through as a probe: if it gets an answer from the engine
+    the breaker closes again, otherwise it stays open for another reset_timeout.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = collections.Counter()
+        self.opened = {}
+        self.probing = set()
+
+    def acquire(self, url):
+        """Raise EngineUnavailable unless a command may be sent to url."""
+        with self.lock:
+            opened = self.opened.get(url)
+            if opened is None:
+                return
+            if url not in self.probing and time.time() - opened >= self.reset_timeout:
+                self.probing.add(url)
+                return
+        raise EngineUnavailable(
+            "engine at {0} is unavailable: {1} transient failures in a row".format(
+                url, self.failures[url]
+            )
+        )
+
+    def record(self, url, failed):
+        """Record the outcome of a command acquire() let through."""
+        with self.lock:
+            self.probing.discard(url)
+            if not failed:
+                self.failures[url] = 0
+                if self.opened.pop(url, None) is not None:
+                    logger.info("run_command | engine at {0} is back".format(url))
+                return
+            self.failures[url] += 1
+            if self.failures[url] >= self.threshold:
+                if url not in self.opened:
+                    logger.error(
+                        "run_command | engine at {0} failed {1} times in a row; "
+                        "failing its commands for {2}s".format(
+                            url, self.failures[url], self.reset_timeout
+                        )
+                    )
+                self.opened[url] = time.time()
+
+
+def retry_reason(error, kind):
+    """Why a failed command is worth retrying, or None if it is not.
+
+    An HTTP code (from the error payload anchore-cli prints) decides first: a
+    4xx is the engine's answer and never retried, so negative checks see it as
+    is. Otherwise the output is matched against the messages of transient
+    failures. A write is only retried on failures that mean the engine never
+    acted on it, so a retry can't apply it twice.
+    """
+    if kind == "wait" or isinstance(error, subprocess.TimeoutExpired):
+        # waits poll the engine until their own timeout, and a deadline is spent
+        return None
+    if isinstance(error, OSError):
+        # connection errors from the http transport
+        if kind != "write" or isinstance(error, ConnectionRefusedError):
+            return type(error).__name__
+        return None
+    if not isinstance(error, subprocess.CalledProcessError):
+        return None
+    if kind == "write":
+        codes, messages = config.retry_write_http_codes, config.retry_write_messages
+    else:
+        codes, messages = config.retry_http_codes, config.retry_messages
+    try:
+        httpcode = json.loads(error.stdout).get("httpcode")
+    except Exception:
+        httpcode = None
+    if isinstance(httpcode, int):
+        if 400 <= httpcode < 500:
+            return None
+        if httpcode in codes:
+            return "HTTP {0}".format(httpcode)
+    output = ""
+    for stream in [error.stdout, error.stderr]:
+        if isinstance(stream, bytes):
+            stream = stream.decode("utf-8", "replace")
+        output += stream or ""
+    for message in messages:
+        if message in output:
+            return message
+    return None
+
+
+def run_with_retries(argv, key, kind):
+    """Run a command through the transport, retrying transient failures.
+
+    A command is retried up to config.retry_attempts times, with capped and
+    jittered backoff in between, and every attempt goes through the circuit
+    breaker of its engine.
+    """
+    url, _, args = key
+    intervals = backoff_intervals(
+        config.retry_initial_interval, config.retry_max_interval, 2
+    )
+    attempt = 0
+    while True:
+        circuit_breaker.acquire(url)
+        try:
+            completed_proc = transport.run(argv, command_timeout(args))
+        except Exception as e:
+            reason = retry_reason(e, kind)
+            circuit_breaker.record(url, reason is not None)
+            if reason is None or attempt >= config.retry_attempts:
+                raise
+        else:
+            circuit_breaker.record(url, False)
+            return completed_proc
+        attempt += 1
+        interval = next(intervals)
+        command_stats.record_retry(args)
+        logger.warning(
+            "run_command | {0} failed ({1}); retry {2}/{3} in {4:.1f}s".format(
+                command_signature(args),
+                reason,
+                attempt,
+                config.retry_attempts,
+                interval,
+            )
+        )
+        time.sleep(interval)
+
+
+def command_timeout(args):
+    """The deadline, in seconds, for a command with these cli args: the
+    config.command_timeouts entry for its "family verb", else its family,
+    else the default."""
+    words = [arg for arg in args if not arg.startswith("--")]
+    timeouts = config.command_timeouts
+    for name in [" ".join(words[:2]), " ".join(words[:1])]:
+        if name in timeouts:
+            return timeouts[name]
+    return timeouts.get("default")
+
+
+def strtobool(value):
+    """Like the deprecated distutils.util.strtobool: 1 for y, yes, t, true, on
+    and 1; 0 for n, no, f, false, off and 0 (ValueError for anything else).
+
+    Importing distutils is slow, and lazily importing it from a step could
+    deadlock against another step's lazy import.
+    """
+    value = value.lower()
+    if value in ["y", "yes", "t", "true", "on", "1"]:
+        return 1
+    if value in ["n", "no", "f", "false", "off", "0"]:
+        return 0
+    raise ValueError("invalid truth value {0!r}".format(value))
+
+
+def parse_response(proc):
+    """Parse the JSON output of a completed command (or CalledProcessError),
+    timing the parse against the command's subcommand."""
+    started = time.time()
+    response = json.loads(proc.stdout)
+    argv = proc.args if isinstance(proc, subprocess.CompletedProcess) else proc.cmd
+    command_stats.record_parse(split_command(argv)[3], time.time() - started)
+    return response
+
+
+class JsonStream:
+    """Incremental reader of a JSON document arriving in chunks.
+
+    Values are decoded one at a time with the C decoder, and consumed input is
+    dropped, so at most a chunk plus the value being decoded is held as text.
+    """
+
+    whitespace = " \t\n\r"
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+
+    def fill(self):
+        """Append the next chunk to the buffer; False at the end of input."""
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                text = chunk
+            else:
+                text = self.text_decoder.decode(chunk)
+            self.buffer = self.buffer[self.pos :] + text
+            self.pos = 0
+            return True
+        return False
+
+    def peek(self):
+        """The next non-whitespace character, or "" at the end of input."""
+        while True:
+            while (
+                self.pos < len(self.buffer) and self.buffer[self.pos] in self.whitespace
+            ):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(
+                "expected one of {0!r} at offset {1}, got {2!r}".format(
+                    chars, self.pos, char
+                )
+            )
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode the next complete value, reading more input until it is."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def stream_chunks(data, size=65536):
+    """Yield data in chunks of size without copying it as a whole."""
+    view = memoryview(data) if isinstance(data, bytes) else data
+    for start in range(0, len(data), size):
+        yield view[start : start + size]
+
+
+def scan_response(proc, key):
+    """Count the items of the `key` array in a command's JSON object output
+    without materialising the array; every item must be a JSON object.
+
+    Returns (item count, the object's other members, response size in bytes).
+    The parse is timed against the command's subcommand, like parse_response.
+    """
+    started = time.time()
+    stream = JsonStream(stream_chunks(proc.stdout))
+    count = 0
+    members = {}
+    stream.expect("{")
+    if stream.peek() == "}":
+        stream.expect("}")
+    else:
+        while True:
+            name = stream.value()
+            stream.expect(":")
+            if name == key:
+                stream.expect("[")
+                if stream.peek() == "]":
+                    stream.expect("]")
+                else:
+                    while True:
+                        item = stream.value()
+                        if not isinstance(item, dict):
+                            raise ValueError(
+                                "{0} item {1} is not an object: {2!r}".format(
+                                    key, count, item
+                                )
+                            )
+                        count += 1
+                        if stream.expect(",]") == "]":
+                            break
+                members[name] = None
+            else:
+                members[name] = stream.value()
+            if stream.expect(",}") == "}":
+                break
+    if stream.peek():
+        raise ValueError("unexpected data after the response object")
+    if key not in members:
+        raise KeyError(key)
+    del members[key]
+    argv = proc.args if isinstance(proc, subprocess.CompletedProcess) else proc.cmd
+    command_stats.record_parse(split_command(argv)[3], time.time() - started)
+    return count, members, len(proc.stdout)
+
+
+def iter_response(proc):
+    """Yield the items of a command's JSON array output one at a time, so a
+    long listing is never decoded all at once.
+
+    The parse (not the consumer's work between items) is timed against the
+    command's subcommand, like parse_response.
+    """
+    elapsed = 0.0
+    started = time.time()
+    stream = JsonStream(stream_chunks(proc.stdout))
+    stream.expect("[")
+    if stream.peek() == "]":
+        stream.expect("]")
+    else:
+        while True:
+            item = stream.value()
+            elapsed += time.time() - started
+            yield item
+            started = time.time()
+            if stream.expect(",]") == "]":
+                break
+    if stream.peek():
+        raise ValueError("unexpected data after the response array")
+    elapsed += time.time() - started
+    argv = proc.args if isinstance(proc, subprocess.CompletedProcess) else proc.cmd
+    command_stats.record_parse(split_command(argv)[3], elapsed)
+
+
+# anchore-cli verbs that only read state; "wait" neither reads a cacheable
+# answer nor changes anything, and every other command is treated as a write
+READ_VERBS = ["list", "get", "status", "errorcodes", "whoami", "content"]
+READ_VERBS += ["metadata", "vuln", "check"]
+
+# command family -> families whose cached responses a write to it invalidates
+INVALIDATES = {
+    "analysis-archive": ["analysis-archive", "image"],
+    "image": ["image", "evaluate", "subscription", "analysis-archive"],
+    "policy": ["policy", "evaluate"],
+    "repo": ["repo", "subscription", "image"],
+    "subscription": ["subscription", "repo"],
+}
+
+
+def classify_command(argv):
+    """Return (cache key, family, "read" | "write" | "wait") for a command."""
+    user, _, url, args = split_command(argv)
+    words = [arg for arg in args if not arg.startswith("--")][:3]
+    family = args[0] if args else ""
+    if "wait" in words:
+        kind = "wait"
+    elif any(word in READ_VERBS for word in words):
+        kind = "read"
+    else:
+        kind = "write"
+    return (url, user, tuple(args)), family, kind
+
+
+# words that name a subcommand rather than one of its arguments
+SUBCOMMAND_WORDS = READ_VERBS + ["add", "del", "delete", "enable", "disable"]
+SUBCOMMAND_WORDS += ["setpassword", "activate", "deactivate", "watch", "unwatch"]
+SUBCOMMAND_WORDS += ["update", "config", "restore", "sync", "wait", "user"]
+SUBCOMMAND_WORDS += ["images", "rules", "feeds", "hub"]
+
+
+def command_signature(args):
+    """Name the anchore-cli subcommand in args, e.g. "account user add"."""
+    words = [arg for arg in args if not arg.startswith("--")]
+    signature = words[:1]
+    for word in words[1:3]:
+        if word not in SUBCOMMAND_WORDS:
+            break
+        signature.append(word)
+    return " ".join(signature)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(0, int(round(pct / 100.0 * len(values) + 0.5)) - 1)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize_latencies(values):
+    """count/min/p50/p95/p99/max of a list of durations, in milliseconds."""
+    values = sorted(values)
+    summary = {"count": len(values)}
+    if values:
+        summary["min"] = round(values[0] * 1000, 3)
+        for pct in [50, 95, 99]:
+            summary["p{0}".format(pct)] = round(percentile(values, pct) * 1000, 3)
+        summary["max"] = round(values[-1] * 1000, 3)
+    return summary
+
+
+class CommandStats:
+    """Per-subcommand timings of every command the driver issues.
+
+    transport is the wall time of the whole command as seen by the driver,
+    spawn the part of it spent starting a process (subprocess transport only),
+    and parse the time spent decoding its JSON output.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def _entry(self, args):
+        signature = command_signature(args)
+        if signature not in self.commands:
+            self.commands[signature] = {
+                "transport": [],
+                "spawn": [],
+                "parse": [],
+                "bytes": 0,
+                "errors": 0,
+                "cache_hits": 0,
+                "retries": 0,
+            }
+        return self.commands[signature]
+
+    def record(self, args, elapsed, result, error=False):
+        stdout = getattr(result, "stdout", None) or b""
+        with self.lock:
+            entry = self._entry(args)
+            entry["transport"].append(elapsed)
+            entry["spawn"].append(getattr(result, "spawn_time", 0.0))
+            entry["bytes"] += len(stdout)
+            if error:
+                entry["errors"] += 1
+
+    def record_parse(self, args, elapsed):
+        with self.lock:
+            self._entry(args)["parse"].append(elapsed)
+
+    def record_cache_hit(self, args):
+        with self.lock:
+            self._entry(args)["cache_hits"] += 1
+
+    def record_retry(self, args):
+        with self.lock:
+            self._entry(args)["retries"] += 1
+
+    def report(self):
+        """Aggregated timings per subcommand, slowest p95 first."""
+        with self.lock:
+            report = {}
+            for signature, entry in self.commands.items():
+                count = len(entry["transport"])
+                report[signature] = {
+                    "transport_ms": summarize_latencies(entry["transport"]),
+                    "spawn_ms": summarize_latencies(entry["spawn"]),
+                    "parse_ms": summarize_latencies(entry["parse"]),
+                    "bytes_total": entry["bytes"],
+                    "bytes_avg": int(entry["bytes"] / count) if count else 0,
+                    "errors": entry["errors"],
+                    "cache_hits": entry["cache_hits"],
+                    "retries": entry["retries"],
+                }
+        return dict(
+            sorted(
+                report.items(),
+                key=lambda item: -(item[1]["transport_ms"].get("p95") or 0),
+            )
+        )
+
+
+def write_timings_report(path, health=None):
+    """Write per-subcommand timings (and step durations, and a summary of the
+    engine's health if it was sampled) as a JSON artifact."""
+    report = {
+        "transport": transport.name,
+        "commands": command_stats.report(),
+        "steps": dict(
+            (name, round(seconds, 3)) for name, seconds in step_durations.items()
+        ),
+        "time_to_ready": dict(
+            (name, round(seconds, 3)) for name, seconds in ready_times.items()
+        ),
+    }
+    if health:
+        report["health"] = health.summary()
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info("main | wrote command timings to {0}".format(path))
+
+
+def write_result_reports(elapsed, shard=None):
+    """Write the JUnit XML and JSON summary reports of the recorded results
+    (named for the shard, if any; see shard_output_file)."""
+    junit_file = shard_output_file(config.junit_file, shard)
+    summary_file = shard_output_file(config.summary_file, shard)
+    cli_driver_reports.write_junit(
+        results.read(),
+        junit_file,
+        sum(results.counts.values()),
+        results.count("positive", "fail") + results.count("negative", "fail"),
+        results.count("positive", "timeout") + results.count("negative", "timeout"),
+        elapsed,
+    )
+    logger.info("main | wrote JUnit report to {0}".format(junit_file))
+    cli_driver_reports.write_summary(
+        results.read(),
+        summary_file,
+        elapsed,
+        steps=step_durations,
+        slowest=config.report_slowest,
+    )
+    logger.info("main | wrote result summary to {0}".format(summary_file))
+
+
+class HealthSampler:
+    """Record the engine's health in the background for the whole run.
+
+    Every interval seconds one thread runs `system status` and `system feeds
+    list` as the admin user and appends a timestamped record of service
+    states, feed record counts, the images still waiting for analysis and how
+    long both commands took to a JSON Lines file (its commands are left out of
+    the per-command timings). Slow checks in the results file can then be
+    lined up with service restarts, busy services or feed syncs. Services going down or coming back up are also logged as seen.
+    """
+
+    def __init__(self, context, path, interval):
+        self.context = copy.deepcopy(context)
+        self.path = path
+        self.interval = interval
+        self.samples = 0
+        self.errors = 0
+        self.services = {}
+        self.transitions = []
+        self.feed_records = []
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.stream = open(self.path, "w")
+        self.thread = threading.Thread(
+            target=self._run, name="health-sampler", daemon=True
+        )
+        self.thread.start()
+        logger.info(
+            "health | sampling engine health every {0}s to {1}".format(
+                self.interval, self.path
+            )
+        )
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.stream.close()
+
+    def _run(self):
+        while True:
+            self.stream.write(json.dumps(self.sample()) + "\n")
+            self.stream.flush()
+            self.samples += 1
+            if self.stopped.wait(self.interval):
+                return
+
+    def _command(self, args):
+        """Run a command; its response and how long it took (None on error)."""
+        started = time.time()
+        try:
+            # parsed directly, so its parse isn't timed against the checks either
+            response = json.loads(
+                run_command(
+                    assemble_command(self.context, args), retry=False, timed=False
+                ).stdout
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.debug("health | error running%s: %s", args, e)
+            return None, None, str(e).strip()
+        return response, round(time.time() - started, 3), None
+
+    def sample(self):
+        record = {"ts": round(time.time(), 3)}
+        status, record["status_s"], record["status_error"] = self._command(
+            " system status"
+        )
+        services = {}
+        for service in (status or {}).get("service_states", []):
+            detail = service["service_detail"]
+            if not isinstance(detail, dict):
+                detail = {"up": detail}
+            name = "{0} ({1})".format(service["servicename"], service["hostid"])
+            services[name] = {
+                "up": bool(detail.get("up")),
+                "busy": bool(detail.get("busy")),
+                "message": service.get("status_message"),
+            }
+            self._transition(record["ts"], name, services[name]["up"])
+        record["services"] = services
+
+        feeds, record["feeds_s"], record["feeds_error"] = self._command(
+            " system feeds list"
+        )
+        groups = {}
+        last_sync = None
+        for feed in feeds or []:
+            for group in feed.get("groups") or []:
+                name = "{0}/{1}".format(feed["name"], group["name"])
+                groups[name] = group.get("record_count")
+                if group.get("last_sync"):
+                    last_sync = max(last_sync or "", group["last_sync"])
+        record["feed_groups"] = groups
+        record["feed_records"] = sum(count or 0 for count in groups.values())
+        record["feed_last_sync"] = last_sync
+        if feeds is not None:
+            self.feed_records.append(record["feed_records"])
+
+        with trackers_lock:
+            trackers = list(image_trackers.values())
+        record["pending_analysis"] = sum(len(tracker.pending) for tracker in trackers)
+        return record
+
+    def _transition(self, ts, service, up):
+        previous = self.services.get(service)
+        self.services[service] = up
+        if previous is None and up or previous == up:
+            return
+        self.transitions.append({"ts": ts, "service": service, "up": up})
+        if up:
+            logger.info("health | service {0} is up".format(service))
+        else:
+            logger.warning("health | service {0} is down".format(service))
+
+    def summary(self):
+        return {
+            "file": self.path,
+            "interval_s": self.interval,
+            "samples": self.samples,
+            "errors": self.errors,
+            "transitions": self.transitions,
+            "feed_records": {
+                "first": self.feed_records[0] if self.feed_records else None,
+                "last": self.feed_records[-1] if self.feed_records else None,
+            },
+        }
+
+
+class ResponseCache:
+    """Bounded LRU of successful read-only responses, keyed by (user, command).
+
+    Entries are dropped whenever a write touches the same resource family (see
+    INVALIDATES), so a cached answer is never older than the last change the
+    driver itself made.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key][1]
+
+    def put(self, key, family, completed_proc):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (family, completed_proc)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, family):
+        families = INVALIDATES.get(family, [family])
+        with self.lock:
+            for key in [k for k, v in self.entries.items() if v[0] in families]:
+                del self.entries[key]
+
+
+class IdentityPool:
+    """Fake account names, user names, emails and passwords for test fixtures.
+
+    One Faker instance is created on first use and seeded once; identities are
+    generated in batches and no value is handed out twice in a run. With a seed
+    the sequence of identities is the same every run.
+    """
+
+    def __init__(self, batch_size, seed=None):
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.seed(seed)
+
+    def seed(self, seed):
+        """Start over with a generator seeded from seed (None: unseeded)."""
+        with self.lock:
+            self.seed_value = seed
+            self.faker = None
+            self.batch = collections.deque()
+            self.used = collections.defaultdict(set)
+
+    def unique(self, kind, value):
+        serial = 1
+        candidate = value
+        while candidate in self.used[kind]:
+            serial += 1
+            candidate = "{0}{1}".format(value, serial)
+        self.used[kind].add(candidate)
+        return candidate
+
+    def refill(self):
+        if self.faker is None:
+            # faker loads all of its providers on import; only pay for that
+            # when a check actually needs a fake identity
+            from faker import Faker
+
+            self.faker = Faker()
+            if self.seed_value is not None:
+                self.faker.seed_instance(self.seed_value)
+        for _ in range(self.batch_size):
+            self.batch.append(
+                {
+                    "account_name": self.unique(
+                        "account", self.faker.name().replace(" ", "")
+                    ),
+                    "user": self.unique("user", self.faker.user_name()),
+                    "email": self.unique("email", self.faker.email()),
+                    "passw": self.faker.password(),
+                }
+            )
+
+    def take(self):
+        """Return a new identity: account_name, user, email and passw."""
+        with self.lock:
+            if not self.batch:
+                self.refill()
+            account = self.batch.popleft()
+        remember_identity("account", account["account_name"])
+        remember_identity("user", account["user"])
+        remember_identity("email", account["email"])
+        remember_identity("password", account["passw"])
+        return account
+
+
 def fake_account_with_user():
-    faker = Faker()
-    account = {}
-    account["account_name"] = faker.name().replace(" ", "")
-    account["user"] = faker.user_name()
-    account["email"] = faker.email()
-    account["passw"] = faker.password()
-    return account
+    return identity_pool.take()
+
+
+def remember_identity(kind, value):
+    """Tell a recording or replaying transport about a randomly generated value,
+    so cassettes can match commands that use it."""
+    identities = getattr(transport, "identities", None)
+    if identities is not None:
+        identities.add(kind, value)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records without formatting them; the listener thread does that.
+
+    The stock QueueHandler merges the message and its arguments on the calling
+    thread so records can be pickled; ours stay in-process, so the checks only
+    pay for putting a record on the queue.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # tracebacks can't wait: the frames they reference may change
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+LOG_FILE = "cli_driver.log"
+LOG_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+
+
+def make_log_file_handler(path):
+    """A handler writing a fresh log to path at config.log_file_level, rotated
+    at config.log_max_bytes if set."""
+    if config.log_max_bytes:
+        filehandler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=config.log_max_bytes,
+            backupCount=config.log_backup_count,
+        )
+        # start every run with a fresh log, as the plain file handler does
+        if os.path.exists(path) and os.path.getsize(path):
+            filehandler.doRollover()
+    else:
+        # opened on the first record, so a shard moving its log elsewhere
+        # before logging anything leaves cli_driver.log alone
+        filehandler = logging.FileHandler(path, "w", delay=True)
+    filehandler.setLevel(logging.getLevelName(config.log_file_level))
+    filehandler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return filehandler
 
 
 def make_logger():
+    """The driver's logger and its listener: checks put records on a queue,
+    and a background listener writes them to stdout (INFO and up) and
+    cli_driver.log (see make_log_file_handler)."""
     logger = logging.getLogger("cli_driver")
-    logger.setLevel(logging.DEBUG)
-    filehandler = logging.FileHandler("cli_driver.log", "w")
-    filehandler.setLevel(logging.DEBUG)
+    file_level = logging.getLevelName(config.log_file_level)
+    logger.setLevel(min(file_level, logging.INFO))
+    filehandler = make_log_file_handler(LOG_FILE)
     streamhandler = logging.StreamHandler(sys.stdout)
     streamhandler.setLevel(logging.INFO)
-    logformat = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
-    filehandler.setFormatter(logformat)
-    streamhandler.setFormatter(logformat)
-    logger.addHandler(streamhandler)
-    logger.addHandler(filehandler)
-    return logger
+    streamhandler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, streamhandler, filehandler, respect_handler_level=True
+    )
+    listener.start()
+    # sys.exit in log_results_summary runs this, so nothing queued is lost
+    atexit.register(listener.stop)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    return logger, listener
+
+
+def move_log_file(path):
+    """Write the log to path from now on instead of cli_driver.log."""
+    filehandler = make_log_file_handler(path)
+    # stopping drains what is already queued into the old file
+    log_listener.stop()
+    streamhandler, old = log_listener.handlers
+    log_listener.handlers = (streamhandler, filehandler)
+    old.close()
+    log_listener.start()
 
 
 def dump_response(component, message):
     if config.dump_responses:
-        logger.debug("{0} | response: {1}".format(component, message))
+        logger.debug("%s | response: %s", component, message)
+
+
+class ResultStore:
+    """Test results, streamed to a JSON Lines file as they are recorded.
+
+    Only the pass/fail counters are kept in memory, so a crash loses nothing
+    already recorded and soak runs don't grow without bound; the summary reads
+    the individual results back from the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.counts = collections.Counter()
+        self.lock = threading.Lock()
+        self.stream = None
+
+    def record(self, result):
+        with self.lock:
+            if self.stream is None:
+                self.stream = open(self.path, "w")
+            self.stream.write(json.dumps(result) + "\n")
+            self.stream.flush()
+            self.counts[(result["polarity"], result["outcome"])] += 1
+
+    def count(self, polarity, outcome):
+        return self.counts[(polarity, outcome)]
+
+    def read(self):
+        """Yield every result recorded so far, oldest first."""
+        with self.lock:
+            if self.stream is None:
+                return
+            self.stream.flush()
+        with open(self.path) as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+
+def known_image(message):
+    """The test image a result message is about, if it names one."""
+    for image in config.test_images + config.malware_images + config.clean_images:
+        short = image.split("/", 1)[1] if image.startswith("docker.io/") else image
+        if image in message or short in message:
+            return image
+    return None
+
+
+def record_result(polarity, outcome, action, message):
+    """Record a result; safe to call from concurrently running steps.
+
+    The duration covers the work done on this thread since its previous result
+    (or since its step started), and the error is that of the last command on
+    this thread that failed in the meantime. If that command timed out, a
+    result saying it didn't succeed (a positive failure, or a negative pass) is
+    recorded as a timeout instead.
+
+    While a load-mode operation is running on this thread the result is only
+    counted against that operation instead.
+    """
+    if getattr(load_state, "active", False):
+        if outcome == "pass":
+            load_state.passes += 1
+        else:
+            load_state.failures += 1
+        return
+    now = time.time()
+    if getattr(result_state, "timed_out", False):
+        if (polarity, outcome) in [("positive", "fail"), ("negative", "pass")]:
+            outcome = "timeout"
+    results.record(
+        {
+            "ts": now,
+            "name": action,
+            "step": getattr(result_state, "step", None),
+            "polarity": polarity,
+            "outcome": outcome,
+            "duration": round(now - getattr(result_state, "mark", now), 3),
+            "image": known_image(message),
+            "user": getattr(result_state, "user", None),
+            "error": getattr(result_state, "error", None)
+            if outcome != "pass"
+            else None,
+            "message": message,
+        }
+    )
+    result_state.mark = now
+    result_state.error = None
+    result_state.timed_out = False
+
+
+def carry_result_state(func):
+    """Wrap func to record its results under this thread's step when it runs on
+    another thread, timed from when it starts there."""
+    step = getattr(result_state, "step", None)
+
+    def run(*args, **kwargs):
+        result_state.step = step
+        result_state.mark = time.time()
+        result_state.error = None
+        result_state.timed_out = False
+        return func(*args, **kwargs)
+
+    return run
 
 
 def log_explicit_failure(test_type, action, message, exit_on_fail=False):
     if test_type == "positive":
         logger.warning(action + " | failed (positive test) " + message)
-        positive_tests["fail"].append("{0} - {1}".format(action, message))
+        record_result("positive", "fail", action, message)
     else:
         logger.warning(action + " | failed (negative (test) " + message)
-        negative_tests["fail"].append("{0} - {1}".format(action, message))
+        record_result("negative", "fail", action, message)
 
 
 def log_results_simple(desired_state, state, test_type, action, message):
     if state == desired_state:
         if test_type == "positive":
             logger.info(action + " | passed (positive test) " + message)
-            positive_tests["pass"].append("{0} - {1}".format(action, message))
+            record_result("positive", "pass", action, message)
         else:
             logger.info(action + " | failed (negative (test) " + message)
-            negative_tests["fail"].append("{0} - {1}".format(action, message))
+            record_result("negative", "fail", action, message)
     else:
         if test_type == "positive":
             logger.info(action + " | failed (positive test) " + message)
-            positive_tests["fail"].append("{0} - {1}".format(action, message))
+            record_result("positive", "fail", action, message)
         else:
             logger.info(action + " | passed (negative test) " + message)
-            negative_tests["pass"].append("{0} - {1}".format(action, message))
+            record_result("negative", "pass", action, message)
+
+
+def backoff_intervals(initial=None, maximum=None, factor=None, jitter=None):
+    """Yield sleep intervals that start short and grow, with jitter, to a ceiling."""
+    initial = config.wait_initial_interval if initial is None else initial
+    maximum = config.wait_max_interval if maximum is None else maximum
+    factor = config.wait_backoff_factor if factor is None else factor
+    jitter = config.wait_jitter if jitter is None else jitter
+    interval = initial
+    while True:
+        yield min(maximum, interval * jitter_random.uniform(1 - jitter, 1 + jitter))
+        interval = min(maximum, interval * factor)
+
+
+def poll_until(probe, timeout, intervals=None):
+    """Call probe() until it returns something truthy or timeout seconds pass.
+
+    Returns the probe's result, or None on timeout. Exceptions from the probe
+    count as "not ready yet".
+    """
+    intervals = intervals or backoff_intervals()
+    deadline = time.time() + timeout
+    while True:
+        try:
+            result = probe()
+            if result:
+                return result
+        except Exception as e:
+            logger.debug("poll_until | probe failed: %s", e)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        time.sleep(min(next(intervals), remaining))
+
+
+def record_time_to_ready(name, seconds):
+    with results_lock:
+        if name not in ready_times:
+            ready_times[name] = seconds
+            logger.info("ready | {0} ready after {1:.1f}s".format(name, seconds))
+
+
+def profile_label(frame):
+    """Label profile samples under a run_command frame with the subcommand it
+    runs (account, image, repo, ...), and others under a run_step frame with
+    the step."""
+    if frame.f_code is run_command.__code__:
+        argv = frame.f_locals.get("argv")
+        if argv:
+            args = split_command(argv)[3]
+            return args[0] if args else None
+    elif frame.f_code is run_step.__code__:
+        step = frame.f_locals.get("step")
+        if step:
+            return "step " + step.name
+    return None
+
+
+def log_profile(profiler, path):
+    profiler.write_collapsed(path)
+    logger.info("profile | wrote collapsed stacks to {0}".format(path))
+    for line in profiler.report(config.profile_top):
+        logger.info("profile | " + line)
 
 
 def log_results_summary():
     logger.info("==============================")
+    if ready_times:
+        logger.info("Time to Ready")
+        for name, seconds in sorted(ready_times.items(), key=lambda item: item[1]):
+            logger.info("\t{0}: {1:.1f}s".format(name, seconds))
+    timings = command_stats.report()
+    if timings:
+        logger.info("Command Timings (ms)")
+        for signature, entry in timings.items():
+            latency = entry["transport_ms"]
+            logger.info(
+                "\t{0:<36} n={1} min={2} p50={3} p95={4} p99={5} max={6} "
+                "parse_p50={7} spawn_p50={8} avg_bytes={9} errors={10}".format(
+                    signature,
+                    latency["count"],
+                    latency.get("min"),
+                    latency.get("p50"),
+                    latency.get("p95"),
+                    latency.get("p99"),
+                    latency.get("max"),
+                    entry["parse_ms"].get("p50"),
+                    entry["spawn_ms"].get("p50"),
+                    entry["bytes_avg"],
+                    entry["errors"],
+                )
+            )
     logger.info("Test Summary")
-    if positive_tests["pass"]:
-        logger.info("Positive Tests Passed")
-        for test in positive_tests["pass"]:
-            logger.info("\t{0}".format(test))
-    if positive_tests["fail"]:
-        logger.info("Positive Tests Failed")
-        for test in positive_tests["fail"]:
-            logger.info("\t{0}".format(test))
-    if negative_tests["pass"]:
-        logger.info("Negative Tests Passed")
-        for test in negative_tests["pass"]:
-            logger.info("\t{0}".format(test))
-    if negative_tests["fail"]:
-        logger.info("Negative Tests Failed")
-        for test in negative_tests["fail"]:
-            logger.info("\t{0}".format(test))
-    logger.info("{0} total positive tests passed".format(len(positive_tests["pass"])))
-    logger.info("{0} total positive tests failed".format(len(positive_tests["fail"])))
-    logger.info("{0} total negative tests passed".format(len(negative_tests["pass"])))
-    logger.info("{0} total negative tests failed".format(len(negative_tests["fail"])))
+    sections = [
+        ("positive", "pass", "Positive Tests Passed"),
+        ("positive", "fail", "Positive Tests Failed"),
+        ("negative", "pass", "Negative Tests Passed"),
+        ("negative", "fail", "Negative Tests Failed"),
+        ("positive", "timeout", "Positive Tests Timed Out"),
+        ("negative", "timeout", "Negative Tests Timed Out"),
+    ]
+    for polarity, outcome, title in sections:
+        if results.count(polarity, outcome):
+            logger.info(title)
+            for result in results.read():
+                if (result["polarity"], result["outcome"]) == (polarity, outcome):
+                    logger.info("\t{0} - {1}".format(result["name"], result["message"]))
+    for polarity, outcome, _ in sections[:4]:
+        logger.info(
+            "{0} total {1} tests {2}".format(
+                results.count(polarity, outcome),
+                polarity,
+                "passed" if outcome == "pass" else "failed",
+            )
+        )
+    timeouts = results.count("positive", "timeout") + results.count(
+        "negative", "timeout"
+    )
+    if timeouts:
+        logger.info("{0} total tests timed out".format(timeouts))
     logger.info("==============================")
-    if len(positive_tests["fail"]) > 0:
+    results.close()
+    if timeouts:
+        logger.warning("One or more tests timed out. Exiting with failure.")
+        sys.exit(1)
+    if results.count("positive", "fail") > 0:
         logger.warning("One or more positive tests failed. Exiting with failure.")
         sys.exit(1)
-    if len(negative_tests["fail"]) > 0:
+    if results.count("negative", "fail") > 0:
         logger.warning("One or more negative tests failed. Exiting with failure.")
         sys.exit(1)
 
@@ -116,9 +1196,9 @@ def log_results_summary():
 def account(context):
     """Invoke the account CLI subcommands."""
     logger.info("account | starting subcommands")
-    faker = Faker()
-    account_name = faker.name().replace(" ", "")
-    account_email = faker.email()
+    identity = identity_pool.take()
+    account_name = identity["account_name"]
+    account_email = identity["email"]
     account_add(context, account_name, account_email)
     account_get(context, account_name)
     account_disable(context, account_name)
@@ -143,12 +1223,10 @@ def account_add(context, name, email, test_type="positive", log=True):
         context, " account add --email {0} {1}".format(email, name)
     )
     if log:
-        logger.debug("account_add | running command {0}".format(command))
+        logger.debug("account_add | running command %s", command)
     try:
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         state = response["state"]
         if log:
             log_results_simple(
@@ -172,11 +1250,9 @@ def account_get(context, name, test_type="positive"):
     logger.info("account_get | starting")
     command = assemble_command(context, " account get {0}".format(name))
     try:
-        logger.debug("account_get | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_get | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         state = response["state"]
         log_results_simple(
             "enabled",
@@ -198,11 +1274,9 @@ def account_disable(context, name, test_type="positive"):
     logger.info("account_disable | starting")
     command = assemble_command(context, " account disable {0}".format(name))
     try:
-        logger.debug("account_disable | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_disable | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         state = response["state"]
         log_results_simple(
             "disabled",
@@ -224,11 +1298,9 @@ def account_enable(context, name, test_type="positive"):
     logger.info("account_enable | starting")
     command = assemble_command(context, " account enable {0}".format(name))
     try:
-        logger.debug("account_enable | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_enable | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         state = response["state"]
         log_results_simple(
             "enabled",
@@ -250,11 +1322,9 @@ def account_del(context, name, test_type="positive"):
     logger.info("account_del | starting")
     command = assemble_command(context, " account del --dontask {0}".format(name))
     try:
-        logger.debug("account_del | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_del | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         state = response["state"]
         log_results_simple(
             "deleting",
@@ -266,7 +1336,7 @@ def account_del(context, name, test_type="positive"):
         logger.info("account_del | finished")
     except Exception as e:
         if isinstance(e, subprocess.CalledProcessError):
-            response = json.loads(e.stdout)
+            response = parse_response(e)
             if (
                 response["message"]
                 == "Invalid account state change requested. Cannot go from state enabled to state deleting"
@@ -314,11 +1384,9 @@ def account_list(context, account_override=False, test_type="positive"):
     command = assemble_command(context, " account list")
 
     try:
-        logger.debug("account_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         number_accounts = len(response)
         log_results_simple(
             "ok",
@@ -330,7 +1398,7 @@ def account_list(context, account_override=False, test_type="positive"):
         logger.info("account_list | finished")
     except Exception as e:
         if isinstance(e, subprocess.CalledProcessError):
-            response = json.loads(e.stdout)
+            response = parse_response(e)
             if account_override:
                 if response == "Unauthorized" or response["httpcode"] == 403:
                     log_results_simple(
@@ -385,11 +1453,9 @@ def account_user_list(context, test_type):
 
     # case 1: default user list
     try:
-        logger.debug("account_user_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_user_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         number_users = len(response)
         if number_users:
             log_results_simple(
@@ -413,18 +1479,16 @@ def account_user_list(context, test_type):
     # case 2: user list for account w/no users
     try:
         # set up - create an account with no users
-        faker = Faker()
-        account_name = faker.name().replace(" ", "")
-        account_email = faker.email()
+        identity = identity_pool.take()
+        account_name = identity["account_name"]
+        account_email = identity["email"]
         account_add(context, account_name, account_email, log=False)
         command = assemble_command(
             context, " account user list --account {0}".format(account_name)
         )
-        logger.debug("account_user_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_user_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         number_users = len(response)
         if not number_users:
             # desired result
@@ -471,11 +1535,9 @@ def account_user_list(context, test_type):
         command = assemble_command(
             context, " account user list --account {0}".format(acct["account_name"])
         )
-        logger.debug("account_user_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_user_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         number_users = len(response)
         if number_users:
             log_results_simple(
@@ -519,11 +1581,9 @@ def account_user_list(context, test_type):
     )
 
     try:
-        logger.debug("account_user_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("account_user_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         number_users = len(response)
         # we expect this to throw an exception
         log_results_simple(
@@ -537,7 +1597,7 @@ def account_user_list(context, test_type):
         )
     except Exception as e:
         if isinstance(e, subprocess.CalledProcessError):
-            response = json.loads(e.stdout)
+            response = parse_response(e)
             if response == "Unauthorized" or response["httpcode"] == 403:
                 log_results_simple(
                     "ok",
@@ -569,12 +1629,10 @@ def account_user_add(context, account, username, userpass, test_type, log=True):
         " account user add --account {0} {1} {2}".format(account, username, userpass),
     )
     if log:
-        logger.debug("account_user_add | running command {0}".format(command))
+        logger.debug("account_user_add | running command %s", command)
     try:
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         created = response["created_at"]
         user = response["username"]
         if log:
@@ -626,10 +1684,10 @@ def account_user_del(context, test_type):
             acct["account_name"], acct["user"]
         ),
     )
-    logger.debug("account_user_del | running command {0}".format(command))
+    logger.debug("account_user_del | running command %s", command)
     try:
         # as long as this doesn't throw an exception or return 4xx, we're ok
-        subprocess.run(command.split(), check=True, stdout=subprocess.PIPE)
+        run_command(command)
         log_results_simple(
             "ok",
             "ok",
@@ -668,10 +1726,10 @@ def account_user_get(context, test_type):
             acct["account_name"], acct["user"]
         ),
     )
-    logger.debug("account_user_get | running command {0}".format(command))
+    logger.debug("account_user_get | running command %s", command)
     try:
         # as long as this doesn't throw an exception or return 4xx, we're ok
-        subprocess.run(command.split(), check=True, stdout=subprocess.PIPE)
+        run_command(command)
         log_results_simple(
             "ok",
             "ok",
@@ -708,10 +1766,10 @@ def account_user_setpassword(context, test_type):
             acct["account_name"], acct["user"], acct["passw"]
         ),
     )
-    logger.debug("account_user_setpassword | running command {0}".format(command))
+    logger.debug("account_user_setpassword | running command %s", command)
     try:
         # as long as this doesn't throw an exception or return 4xx, we're ok
-        subprocess.run(command.split(), check=True, stdout=subprocess.PIPE)
+        run_command(command)
         log_results_simple(
             "ok",
             "ok",
@@ -752,10 +1810,10 @@ def account_whoami(context, test_type="positive"):
         log=False,
     )
     command = assemble_command(context, " account whoami")
-    logger.debug("account_whoami | running command {0}".format(command))
+    logger.debug("account_whoami | running command %s", command)
     try:
         # as long as this doesn't throw an exception or return 4xx, we're ok
-        subprocess.run(command.split(), check=True, stdout=subprocess.PIPE)
+        run_command(command)
         log_results_simple(
             "ok",
             "ok",
@@ -812,40 +1870,15 @@ def analysis_archive_images_add(context, test_type="positive"):
         return
 
     # Wait for the image to be available
-    wait_command = assemble_command(context, " image wait {0}".format(image))
-    try:
-        logger.debug(
-            "analysis_archive_images_add | running command {0}".format(wait_command)
-        )
-        logger.info(
-            "analysis_archive_images_add | waiting for image {0} to be available".format(
-                image
-            )
-        )
-        subprocess.run(wait_command.split(), check=True, stdout=subprocess.PIPE)
-    except Exception as e:
-        logger.debug(
-            "analysis_archive_images_add | something went a bit wrong waiting for image: {0}".format(
-                e
-            )
-        )
-        logger.info(
-            "analysis_archive_images_add | call failed waiting for image; returning. Exception: {0}".format(
-                e
-            )
-        )
+    if not wait_for_image(context, image, "analysis_archive_images_add"):
         return
     try:
         command = assemble_command(
             context, " analysis-archive images add {0}".format(image_sha)
         )
-        logger.debug(
-            "analysis_archive_images_add | running command {0}".format(command)
-        )
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("analysis_archive_images_add | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("analysis_archive_images_add", response)
         status = response[0]["status"]
         log_results_simple(
@@ -856,9 +1889,7 @@ def analysis_archive_images_add(context, test_type="positive"):
             "archived image {0}".format(image),
         )
     except Exception as e:
-        logger.debug(
-            "analysis_archive_images_add | something went a bit wrong: {0}".format(e)
-        )
+        logger.debug("analysis_archive_images_add | something went a bit wrong: %s", e)
         logger.info(
             "analysis_archive_images_add | call failed; returning. Exception: {0}".format(
                 e
@@ -890,40 +1921,15 @@ def analysis_archive_images_del(context, test_type="positive"):
         return
 
     # Wait for the image to be available
-    wait_command = assemble_command(context, " image wait {0}".format(image))
-    try:
-        logger.debug(
-            "analysis_archive_images_del | running command {0}".format(wait_command)
-        )
-        logger.info(
-            "analysis_archive_images_del | waiting for image {0} to be available".format(
-                image
-            )
-        )
-        subprocess.run(wait_command.split(), check=True, stdout=subprocess.PIPE)
-    except Exception as e:
-        logger.debug(
-            "analysis_archive_images_del | something went a bit wrong waiting for image: {0}".format(
-                e
-            )
-        )
-        logger.info(
-            "analysis_archive_images_del | call failed waiting for image; returning. Exception: {0}".format(
-                e
-            )
-        )
+    if not wait_for_image(context, image, "analysis_archive_images_del"):
         return
     try:
         command = assemble_command(
             context, " analysis-archive images del {0}".format(image_sha)
         )
-        logger.debug(
-            "analysis_archive_images_del | running command {0}".format(command)
-        )
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("analysis_archive_images_del | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("analysis_archive_images_del", response)
         # If the image was in the archive, the response will be empty; if not, it'll return
         # 404 w/a message in JSON, and a non-zero exit code from the CLI, which has to be
@@ -939,7 +1945,7 @@ def analysis_archive_images_del(context, test_type="positive"):
             )
     except Exception as e:
         if isinstance(e, subprocess.CalledProcessError):
-            response = json.loads(e.stdout)
+            response = parse_response(e)
             status_code = response["httpcode"]
             message = response["message"]
             log_msg = "Attempted to delete image {0} from archive, but it was not in the archive; message: {1} HTTP status code: {2}"
@@ -952,9 +1958,7 @@ def analysis_archive_images_del(context, test_type="positive"):
             )
         else:
             logger.debug(
-                "analysis_archive_images_del | something went a bit wrong: {0}".format(
-                    e
-                )
+                "analysis_archive_images_del | something went a bit wrong: %s", e
             )
             logger.info(
                 "analysis_archive_images_del | call failed; returning. Exception: {0}".format(
@@ -1015,33 +2019,14 @@ def evaluate_check(context, test_type="positive"):
     image = random.choice(config.test_images)
 
     # Wait for the image to be available
-    wait_command = assemble_command(context, " image wait {0}".format(image))
-    try:
-        logger.debug("evaluate_check | running command {0}".format(wait_command))
-        logger.info(
-            "evaluate_check | waiting for image {0} to be available".format(image)
-        )
-        subprocess.run(wait_command.split(), check=True, stdout=subprocess.PIPE)
-    except Exception as e:
-        logger.debug(
-            "evaluate_check | something went a bit wrong waiting for image: {0}".format(
-                e
-            )
-        )
-        logger.info(
-            "evaluate_check | call failed waiting for image; returning. Exception: {0}".format(
-                e
-            )
-        )
+    if not wait_for_image(context, image, "evaluate_check"):
         return
 
     try:
         command = assemble_command(context, " evaluate check {0}".format(image))
-        logger.debug("evaluate_check | running command {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("evaluate_check | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         if not response:
             log_explicit_failure(
                 test_type,
@@ -1054,8 +2039,10 @@ def evaluate_check(context, test_type="positive"):
             "ok", "ok", test_type, "evaluate_check", "evaluated image {0}".format(image)
         )
     except Exception as e:
-        logger.debug("evaluate_check | something went a bit wrong: {0}".format(e))
-        logger.info("evaluate_check | call failed; returning. Exception: {0}".format(e))
+        log_explicit_failure(
+            test_type, "evaluate_check", "failed to evaluate image {0}".format(image)
+        )
+        logger.error("evaluate_check | error calling anchore-cli: {0}".format(e))
     logger.info("evaluate_check | finished")
 
 
@@ -1085,20 +2072,168 @@ def event_list():
 # /Event
 
 # Image
+def normalize_image(image):
+    """Expand an image reference the way the engine does (docker.io registry and
+    latest tag by default), so e.g. alpine:latest matches docker.io/alpine:latest."""
+    first = image.split("/")[0]
+    if "/" not in image or not ("." in first or ":" in first or first == "localhost"):
+        image = "docker.io/" + image
+    if ":" not in image.split("/")[-1] and "@" not in image:
+        image = image + ":latest"
+    return image
+
+
+class ImageReadinessTracker:
+    """Follow the analysis status of images for one user.
+
+    A single background thread polls `image list` for every tracked image that
+    has not reached a terminal status, so checks block only on the image they
+    need instead of each running its own `image wait`.
+    """
+
+    # images missing from `image list` are reported as not_found, the same way
+    # `image wait` fails fast on an image that was never added
+    terminal_states = ["analyzed", "analysis_failed", "not_found"]
+
+    def __init__(self, context):
+        self.context = copy.deepcopy(context)
+        self.statuses = {}
+        self.tracked_at = {}
+        self.pending = set()
+        self.condition = threading.Condition()
+        self.poller = None
+        self.intervals = backoff_intervals()
+
+    def track(self, image):
+        """Start following an image (no-op if it is already tracked)."""
+        image = normalize_image(image)
+        with self.condition:
+            if image in self.statuses:
+                return
+            self.statuses[image] = None
+            self.tracked_at[image] = time.time()
+            self.pending.add(image)
+            # poll quickly again while the new image is young
+            self.intervals = backoff_intervals()
+            if self.poller is None or not self.poller.is_alive():
+                self.poller = threading.Thread(
+                    target=self._poll, name="image-tracker", daemon=True
+                )
+                self.poller.start()
+
+    def wait(self, image, timeout=None):
+        """Block until the image reaches a terminal status; return the status,
+        or None if the timeout expired first."""
+        image = normalize_image(image)
+        self.track(image)
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.statuses[image] in self.terminal_states, timeout
+            ):
+                return None
+            return self.statuses[image]
+
+    def _poll(self):
+        command = assemble_command(self.context, " image list")
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.poller = None
+                    return
+            try:
+                found = image_statuses(run_command(command, retry=False))
+                with self.condition:
+                    for image in list(self.pending):
+                        self.statuses[image] = found.get(image, "not_found")
+                        if self.statuses[image] in self.terminal_states:
+                            self.pending.discard(image)
+                            record_time_to_ready(
+                                "image {0} ({1})".format(image, self.statuses[image]),
+                                time.time() - self.tracked_at[image],
+                            )
+                    self.condition.notify_all()
+                    interval = next(self.intervals)
+            except Exception as e:
+                logger.debug("image_tracker | error polling images: %s", e)
+                interval = next(self.intervals)
+            time.sleep(interval)
+
+
+def image_statuses(proc):
+    """Map every tag in `image list` output to its analysis status, reading
+    the records one at a time."""
+    found = {}
+    for record in iter_response(proc):
+        # a tag can appear on several records; the newest one counts
+        for detail in record["image_detail"]:
+            tag = normalize_image(detail["fulltag"])
+            created = detail.get("created_at") or ""
+            if tag not in found or created >= found[tag][0]:
+                found[tag] = (created, record["analysis_status"])
+    return dict((tag, status) for tag, (_, status) in found.items())
+
+
+def image_tracker(context):
+    """Return the readiness tracker for the context's user, creating it if needed."""
+    key = (context["api_url"], context["user"])
+    with trackers_lock:
+        if key not in image_trackers:
+            image_trackers[key] = ImageReadinessTracker(context)
+        return image_trackers[key]
+
+
+def wait_for_image(context, image, action):
+    """Block until the image has finished analysis; False if it never will."""
+    logger.info("{0} | waiting for image {1} to be available".format(action, image))
+    status = image_tracker(context).wait(image, config.image_wait_timeout)
+    if status is None:
+        logger.info(
+            "{0} | call failed waiting for image; returning. Timed out after {1}s".format(
+                action, config.image_wait_timeout
+            )
+        )
+        return False
+    if status == "not_found":
+        logger.info(
+            "{0} | call failed waiting for image; returning. Image {1} not found".format(
+                action, image
+            )
+        )
+        return False
+    if status == "analysis_failed":
+        logger.info(
+            "{0} | call failed waiting for image; returning. Analysis of image {1} "
+            "failed".format(action, image)
+        )
+        return False
+    logger.debug("%s | image %s status: %s", action, image, status)
+    return True
+
+
 def image(context):
     """Invoke the image CLI subcommands, other than image deletion (because other commands depend on images being in place)."""
     logger.info("image | starting subcommands")
     image_add(context)
+    image_checks(context)
+
+
+def image_checks(context):
+    """Invoke the image CLI subcommands that need images to have been added."""
     image_wait(context)
     image_get(context)
-    image_content(context)
-    image_content(context, content_type="malware")
+    image_content_checks(context)
     image_metadata(context)
     image_list(context)
     image_vuln(context)
     # image_import(context)
 
 
+def image_content_checks(context):
+    """Invoke the image content CLI subcommand for all types, then for malware."""
+    image_content(context)
+    image_content(context, content_type="malware")
+
+
 def image_deletion(context):
     """Invoke the image del CLI subcommand."""
     image_del(context, test_type="negative")
@@ -1106,35 +2241,45 @@ def image_deletion(context):
 
 
 def image_add(context, test_type="positive"):
-    """Invoke the image add CLI subcommand."""
+    """Invoke the image add CLI subcommand for every test image, concurrently."""
     logger.info("image_add | starting")
-    for image in config.test_images + config.malware_images + config.clean_images:
-        command = assemble_command(context, " image add {0}".format(image))
-        try:
-            logger.debug("image_add | running command {0}".format(command))
-            completed_proc = subprocess.run(
-                command.split(), check=True, stdout=subprocess.PIPE
-            )
-            response = json.loads(completed_proc.stdout)
-            image_status = response[0]["image_status"]
-            logger.info(
-                "image_add | added image {0}; status: {1}".format(image, image_status)
+    images = config.test_images + config.malware_images + config.clean_images
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=config.image_add_workers
+    ) as executor:
+        for image in images:
+            executor.submit(
+                carry_result_state(image_add_one), context, image, test_type
             )
-            log_results_simple(
-                image_status,
-                "active",
-                test_type,
-                "image_add",
-                "added image {0}".format(image),
-            )
-        except Exception as e:
-            log_explicit_failure(
-                test_type, "image_add", "failed to add image {0}".format(image)
-            )
-            logger.error("image_add | error calling anchore-cli: {0}".format(e))
     logger.info("image_add | finished")
 
 
+def image_add_one(context, image, test_type="positive"):
+    """Add a single image and start tracking its analysis status."""
+    command = assemble_command(context, " image add {0}".format(image))
+    try:
+        logger.debug("image_add | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
+        image_status = response[0]["image_status"]
+        logger.info(
+            "image_add | added image {0}; status: {1}".format(image, image_status)
+        )
+        log_results_simple(
+            image_status,
+            "active",
+            test_type,
+            "image_add",
+            "added image {0}".format(image),
+        )
+        image_tracker(context).track(image)
+    except Exception as e:
+        log_explicit_failure(
+            test_type, "image_add", "failed to add image {0}".format(image)
+        )
+        logger.error("image_add | error calling anchore-cli: {0}".format(e))
+
+
 def image_content(context, test_type="positive", content_type="all"):
     """Invoke the image content CLI subcommand."""
     logger.info("image_content | starting")
@@ -1145,35 +2290,16 @@ def image_content(context, test_type="positive", content_type="all"):
         image = random.choice(config.test_images)
 
     # Wait for the image to be available
-    command = assemble_command(context, " image wait {0}".format(image))
-    try:
-        logger.debug("image_content | running command {0}".format(command))
-        logger.info(
-            "image_content | waiting for image {0} to be available".format(image)
-        )
-        subprocess.run(command.split(), check=True, stdout=subprocess.PIPE)
-    except Exception as e:
-        logger.debug(
-            "image_content | something went a bit wrong waiting for image: {0}".format(
-                e
-            )
-        )
-        logger.info(
-            "image_content | call failed waiting for image; returning. Exception: {0}".format(
-                e
-            )
-        )
+    if not wait_for_image(context, image, "image_content"):
         return
 
     # Get the content types for our random image
     try:
 
         command = assemble_command(context, " image content {0}".format(image))
-        logger.debug("image_content | running command {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("image_content | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         if not response:
             log_explicit_failure(
                 test_type,
@@ -1197,20 +2323,16 @@ def image_content(context, test_type="positive", content_type="all"):
             command = assemble_command(
                 context, " image content {0} {1}".format(image, content)
             )
-            logger.debug("image_content | running command {0}".format(command))
-            completed_proc = subprocess.run(
-                command.split(), check=True, stdout=subprocess.PIPE
-            )
-            response = json.loads(completed_proc.stdout)
-            content_length = len(response["content"])
+            logger.debug("image_content | running command %s", command)
+            completed_proc = run_command(command)
+            content_length, _, size = scan_response(completed_proc, "content")
             logger.info(
-                "image_content | found {0} of content type {1} in image {2}".format(
-                    content_length, content, image
-                )
+                "image_content | found {0} of content type {1} in image {2} "
+                "({3} bytes)".format(content_length, content, image, size)
             )
 
     except Exception as e:
-        logger.debug("image_content | something went a bit wrong: {0}".format(e))
+        logger.debug("image_content | something went a bit wrong: %s", e)
         logger.info("image_content | call failed; returning. Exception: {0}".format(e))
         return
 
@@ -1228,34 +2350,19 @@ def image_del(context, force=False, test_type="positive"):
     """Invoke the image del CLI subcommand."""
     logger.info("image_del | starting")
 
-    image = random.choice(config.test_images)
-    command = assemble_command(context, " image del {0}".format(image))
-    if force:
-        command = assemble_command(context, " image del --force {0}".format(image))
-
-    # Wait for the image to be available
-    wait_command = assemble_command(context, " image wait {0}".format(image))
-    try:
-        logger.debug("image_del | running command {0}".format(wait_command))
-        logger.info("image_del | waiting for image {0} to be available".format(image))
-        subprocess.run(wait_command.split(), check=True, stdout=subprocess.PIPE)
-    except Exception as e:
-        logger.debug(
-            "image_del | something went a bit wrong waiting for image: {0}".format(e)
-        )
-        logger.info(
-            "image_del | call failed waiting for image; returning. Exception: {0}".format(
-                e
-            )
-        )
+    image = random.choice(config.test_images)
+    command = assemble_command(context, " image del {0}".format(image))
+    if force:
+        command = assemble_command(context, " image del --force {0}".format(image))
+
+    # Wait for the image to be available
+    if not wait_for_image(context, image, "image_del"):
         return
 
     try:
-        logger.debug("image_del | running command {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("image_del | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         status = response["status"]
         log_results_simple(
             "deleting", status, test_type, "image_del", "delete image {0}".format(image)
@@ -1263,7 +2370,7 @@ def image_del(context, force=False, test_type="positive"):
         logger.info("image_del | finished")
     except Exception as e:
         if isinstance(e, subprocess.CalledProcessError):
-            response = json.loads(e.stdout)
+            response = parse_response(e)
             if (
                 response["message"]
                 == "cannot delete image that is the latest of its tags, and has active subscription"
@@ -1292,12 +2399,14 @@ def image_del(context, force=False, test_type="positive"):
 
 def random_image_data(context):
     """Helper method to grab random image metadata (for one image)."""
-    images = image_get(context, return_images=True, log=False)
+    images = image_get(context, return_images=True, log=False, cached=True)
     return random.choice(images)
 
 
 # Note, you don't have to wait for the image to be available to call `image get`
-def image_get(context, test_type="positive", return_images=False, log=True):
+def image_get(
+    context, test_type="positive", return_images=False, log=True, cached=False
+):
     """Invoke the image get CLI subcommand."""
     images = []
     if log:
@@ -1306,12 +2415,10 @@ def image_get(context, test_type="positive", return_images=False, log=True):
         command = assemble_command(context, " image get {0}".format(image))
         try:
             if log:
-                logger.debug("image_get | running command {0}".format(command))
-            completed_proc = subprocess.run(
-                command.split(), check=True, stdout=subprocess.PIPE
-            )
+                logger.debug("image_get | running command %s", command)
+            completed_proc = run_command(command, cached=cached)
             if return_images:
-                images.append(json.loads(completed_proc.stdout))
+                images.append(parse_response(completed_proc))
             # as long as this doesn't throw an exception or return 4xx, we're ok
             if log:
                 log_results_simple(
@@ -1340,11 +2447,9 @@ def image_list(context, test_type="positive"):
     command = assemble_command(context, " image list")
 
     try:
-        logger.debug("image_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("image_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         number_images = len(response)
         # as long as this doesn't throw an exception or return 4xx, we're ok
         log_results_simple(
@@ -1368,35 +2473,16 @@ def image_metadata(context, test_type="positive"):
     command = assemble_command(context, " image metadata {0}".format(image))
 
     # Wait for the image to be available
-    wait_command = assemble_command(context, " image wait {0}".format(image))
-    try:
-        logger.debug("image_metadata | running command {0}".format(wait_command))
-        logger.info(
-            "image_metadata | waiting for image {0} to be available".format(image)
-        )
-        subprocess.run(wait_command.split(), check=True, stdout=subprocess.PIPE)
-    except Exception as e:
-        logger.debug(
-            "image_metadata | something went a bit wrong waiting for image: {0}".format(
-                e
-            )
-        )
-        logger.info(
-            "image_metadata | call failed waiting for image; returning. Exception: {0}".format(
-                e
-            )
-        )
+    if not wait_for_image(context, image, "image_metadata"):
         return
 
     # First, we invoke the command without a metadata type; we expect to get back
     # a JSON blob w/manifest, docker_history, and dockerfile metadata types.
     # Then, we call for each of those types of metadata from the image.
     try:
-        logger.debug("image_metadata | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("image_metadata | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         failed = False
         for key in config.metadata_types:
             if not key in response:
@@ -1409,10 +2495,8 @@ def image_metadata(context, test_type="positive"):
             subcommand = assemble_command(
                 context, " image metadata {0} {1}".format(image, key)
             )
-            sub_proc = subprocess.run(
-                subcommand.split(), check=True, stdout=subprocess.PIPE
-            )
-            sub_json = json.loads(sub_proc.stdout)
+            sub_proc = run_command(subcommand)
+            sub_json = parse_response(sub_proc)
             m_type = sub_json["metadata_type"]
             if not m_type or m_type != key:
                 failed = True
@@ -1448,20 +2532,7 @@ def image_vuln(context, test_type="positive"):
     image = random.choice(config.test_images)
 
     # Wait for the image to be available
-    wait_command = assemble_command(context, " image wait {0}".format(image))
-    try:
-        logger.debug("image_vuln | running command {0}".format(wait_command))
-        logger.info("image_vuln | waiting for image {0} to be available".format(image))
-        subprocess.run(wait_command.split(), check=True, stdout=subprocess.PIPE)
-    except Exception as e:
-        logger.debug(
-            "image_vuln | something went a bit wrong waiting for image: {0}".format(e)
-        )
-        logger.info(
-            "image_vuln | call failed waiting for image; returning. Exception: {0}".format(
-                e
-            )
-        )
+    if not wait_for_image(context, image, "image_vuln"):
         return
 
     try:
@@ -1470,13 +2541,14 @@ def image_vuln(context, test_type="positive"):
             command = assemble_command(
                 context, " image vuln {0} {1}".format(image, key)
             )
-            logger.debug("image_vuln | running command: {0}".format(command))
-            completed_proc = subprocess.run(
-                command.split(), check=True, stdout=subprocess.PIPE
-            )
-            response = json.loads(completed_proc.stdout)
+            logger.debug("image_vuln | running command: %s", command)
+            completed_proc = run_command(command)
+            num_vulns, response, size = scan_response(completed_proc, "vulnerabilities")
             vuln_type = response["vulnerability_type"]
-            num_vulns = len(response["vulnerabilities"])
+            logger.info(
+                "image_vuln | {0} vulnerabilities of type {1} for image {2} "
+                "({3} bytes)".format(num_vulns, key, image, size)
+            )
             if not vuln_type or vuln_type != key:
                 failed = True
                 log_explicit_failure(
@@ -1519,28 +2591,13 @@ def image_wait(context, timeout=-1, interval=5, test_type="positive"):
     )
 
     # Wait for the image to be available
-    wait_command = assemble_command(context, " image wait {0}".format(image))
-    try:
-        logger.debug("image_wait | running command {0}".format(wait_command))
-        logger.info("image_wait | waiting for image {0} to be available".format(image))
-        subprocess.run(wait_command.split(), check=True, stdout=subprocess.PIPE)
-    except Exception as e:
-        logger.debug(
-            "image_wait | something went a bit wrong waiting for image: {0}".format(e)
-        )
-        logger.info(
-            "image_wait | call failed waiting for image; returning. Exception: {0}".format(
-                e
-            )
-        )
+    if not wait_for_image(context, image, "image_wait"):
         return
 
     try:
-        logger.debug("image_wait | running command {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("image_wait | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         status = response[0]["analysis_status"]
         log_results_simple(
             "analyzed",
@@ -1551,7 +2608,7 @@ def image_wait(context, timeout=-1, interval=5, test_type="positive"):
         )
         logger.info("image_wait | finished")
     except Exception as e:
-        logger.debug("image_wait | something went a bit wrong: {0}".format(e))
+        logger.debug("image_wait | something went a bit wrong: %s", e)
         logger.info("image_wait | call failed; returning. Exception: {0}".format(e))
 
 
@@ -1641,11 +2698,9 @@ def repo_add(context, test_type="positive"):
     for repo in config.repositories:
         command = assemble_command(context, " repo add {0}".format(repo))
         try:
-            logger.debug("repo_add | running command {0}".format(command))
-            completed_proc = subprocess.run(
-                command.split(), check=True, stdout=subprocess.PIPE
-            )
-            response = json.loads(completed_proc.stdout)
+            logger.debug("repo_add | running command %s", command)
+            completed_proc = run_command(command)
+            response = parse_response(completed_proc)
             dump_response("repo_add", response)
             repo_active = response[0]["active"]
             logger.info(
@@ -1670,10 +2725,8 @@ def repo_del(context, test_type="positive"):
     repo = random.choice(config.repositories)
     command = assemble_command(context, " repo del {0}".format(repo))
     try:
-        logger.debug("repo_del | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
+        logger.debug("repo_del | running command: %s", command)
+        completed_proc = run_command(command)
         # This is a bit silly, but the API/CLI is returning a byte literal w/newline, like: b'true\n'
         response = bool(strtobool(completed_proc.stdout.decode("utf-8").rstrip()))
         dump_response("repo_del", response)
@@ -1698,11 +2751,9 @@ def repo_get(context, test_type="positive"):
     for repo in config.repositories:
         command = assemble_command(context, " repo get {0}".format(repo))
         try:
-            logger.debug("repo_get | running command: {0}".format(command))
-            completed_proc = subprocess.run(
-                command.split(), check=True, stdout=subprocess.PIPE
-            )
-            response = json.loads(completed_proc.stdout)
+            logger.debug("repo_get | running command: %s", command)
+            completed_proc = run_command(command)
+            response = parse_response(completed_proc)
             dump_response("repo_get", response)
             repo_active = response[0]["active"]
             # As long as this doesn't throw an exception or return 4xx, we're ok;
@@ -1729,11 +2780,9 @@ def repo_list(context, test_type="positive"):
 
     command = assemble_command(context, " repo list")
     try:
-        logger.debug("repo_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("repo_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("repo_list", response)
         number_repos = len(response)
         # as long as this doesn't throw an exception or return 4xx, we're ok
@@ -1753,11 +2802,9 @@ def repo_unwatch(context, test_type="positive"):
     repo = random.choice(config.repositories)
     command = assemble_command(context, " repo unwatch {0}".format(repo))
     try:
-        logger.debug("repo_unwatch | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("repo_unwatch | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("repo_unwatch", response)
         repo_active = response[0]["active"]
         logger.info(
@@ -1785,11 +2832,9 @@ def repo_watch(context, test_type="positive"):
     repo = random.choice(config.repositories)
     command = assemble_command(context, " repo watch {0}".format(repo))
     try:
-        logger.debug("repo_watch | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("repo_watch | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("repo_watch", response)
         repo_active = response[0]["active"]
         logger.info(
@@ -1821,13 +2866,11 @@ def subscription_get_one(context):
     """Helper method to grab just one subscription."""
     command = assemble_command(context, " subscription list")
     try:
-        logger.debug("subscription_get_one | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("subscription_get_one | running command: %s", command)
+        completed_proc = run_command(command, cached=True)
+        response = parse_response(completed_proc)
         sub = random.choice(response)
-        logger.debug("subscrption_get_one | returning subscription {0}".format(sub))
+        logger.debug("subscrption_get_one | returning subscription %s", sub)
         return sub
     except Exception as e:
         logger.error("subscription_get_one | error calling anchore-cli: {0}".format(e))
@@ -1839,16 +2882,14 @@ def subscription_list(context, test_type="positive"):
 
     command = assemble_command(context, " subscription list")
     try:
-        logger.debug("subscription_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("subscription_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         number_subs = len(response)
         logger.info("subscrption_list | found {0} subscriptions".format(number_subs))
         dump_response("subscription_list", response)
         for sub in response:
-            logger.debug("subscription_list | {0}".format(sub))
+            logger.debug("subscription_list | %s", sub)
         log_results_simple(
             "ok",
             "ok",
@@ -1876,11 +2917,9 @@ def subscription_activate(context, test_type="positive"):
         context, " subscription activate {0} {1}".format(sub_type, sub_key)
     )
     try:
-        logger.debug("subscription_activate | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("subscription_activate | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("subscription_activate", response)
         sub_active = response[0]["active"]
         logger.info(
@@ -1913,11 +2952,9 @@ def subscription_deactivate(context, test_type="positive"):
         context, " subscription deactivate {0} {1}".format(sub_type, sub_key)
     )
     try:
-        logger.debug("subscription_deactivate | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("subscription_deactivate | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("subscription_deactivate", response)
         sub_active = response[0]["active"]
         logger.info(
@@ -1998,7 +3035,7 @@ def system_feeds_config_toggle(context, test_type="positive", enable=True):
     # Iterate through the feeds, then groups, until e find a (en|dis)abled group
     # to toggle. Doing this randomly instead leads to rather more code, so even if
     # this is naive (as it just takes the first thing it can toggle) it's simpler.
-    feeds = system_feeds_list(context, return_feeds=True, log=False)
+    feeds = system_feeds_list(context, return_feeds=True, log=False, cached=True)
     if not feeds:
         logger.info("system_feeds_config_toggle | No feeds available")
         log_explicit_failure(
@@ -2028,13 +3065,9 @@ def system_feeds_config_toggle(context, test_type="positive", enable=True):
         ),
     )
     try:
-        logger.debug(
-            "system_feeds_config_toggle | running command: {0}".format(command)
-        )
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("system_feeds_config_toggle | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("system_feeds_config_toggle", response[0])
         if response[0]["enabled"] == enable:
             message = "{0} feed {1} group {2}".format(end_state, feed_name, group_name)
@@ -2064,7 +3097,7 @@ def system_feeds_delete(context, test_type="positive"):
     logger.info("system_feeds_delete | starting")
 
     # Get feeds/groups, find one that's disabled, delete it
-    feeds = system_feeds_list(context, return_feeds=True, log=False)
+    feeds = system_feeds_list(context, return_feeds=True, log=False, cached=True)
     if not feeds:
         logger.info("system_feeds_delete | No feeds available")
         log_explicit_failure(test_type, "system_feeds_delete", "No feeds available")
@@ -2081,11 +3114,9 @@ def system_feeds_delete(context, test_type="positive"):
         context, " system feeds delete --group {0} {1}".format(group_name, feed_name)
     )
     try:
-        logger.debug("system_feeds_delete | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("system_feeds_delete | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("system_feeds_config_toggle", response[0])
         # Enabled shows up as false after deletion, but I don't see a status otherwise;
         # other than getting an error from the API, I assume this worked
@@ -2104,7 +3135,9 @@ def system_feeds_delete(context, test_type="positive"):
         logger.error("system_feeds_delete | error calling anchore-cli: {0}".format(e))
 
 
-def system_feeds_list(context, test_type="positive", return_feeds=False, log=True):
+def system_feeds_list(
+    context, test_type="positive", return_feeds=False, log=True, cached=False
+):
     """Invoke the system feeds list CLI subcommand."""
     if log:
         logger.info("system_feeds_list | starting")
@@ -2112,20 +3145,18 @@ def system_feeds_list(context, test_type="positive", return_feeds=False, log=Tru
     command = assemble_command(context, " system feeds list")
     try:
         if log:
-            logger.debug("system_feeds_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+            logger.debug("system_feeds_list | running command: %s", command)
+        completed_proc = run_command(command, cached=cached)
+        response = parse_response(completed_proc)
         if log:
             dump_response("system_feeds_list", response[0])
             for feed in response:
-                logger.debug("feed: {0}".format(feed["name"]))
+                logger.debug("feed: %s", feed["name"])
                 for group in feed["groups"]:
                     logger.debug(
-                        "    group: {0}; records: {1}".format(
-                            group["name"], group["record_count"]
-                        )
+                        "    group: %s; records: %s",
+                        group["name"],
+                        group["record_count"],
                     )
         number_feeds = len(response)
         # as long as this doesn't throw an exception or return 4xx, we're ok
@@ -2153,11 +3184,9 @@ def system_status(context, test_type="positive"):
 
     command = assemble_command(context, " system status")
     try:
-        logger.debug("system_status | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("system_status | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("system_status", response)
         for service in response["service_states"]:
             if type(service["service_detail"]) == str:
@@ -2189,11 +3218,9 @@ def system_errorcodes(context, test_type="positive"):
 
     command = assemble_command(context, " system errorcodes")
     try:
-        logger.debug("system_errorcodes | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("system_errorcodes | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("system_errorcodes", response)
         for code in response:
             logger.info("system_errorcodes | error code: {0}".format(code["name"]))
@@ -2214,34 +3241,84 @@ def system_errorcodes(context, test_type="positive"):
 
 
 def system_wait(context, log=True):
+    """Wait for the engine's services to be up and its feeds to have synced.
+
+    Same readiness criteria as `anchore-cli system wait`, but polled with
+    adaptive backoff, recording how long each service and feed took. Returns
+    whether the system became ready before the timeout.
+    """
     if log:
         logger.info("system_wait | starting")
-    image = random.choice(config.test_images)
-    wait = config.default_system_wait_timeout
-    interval = config.default_system_wait_interval
+        logger.info("system_wait | waiting for system to be available")
+    started = time.time()
+    status_command = assemble_command(context, " system status")
+    feeds_command = assemble_command(context, " system feeds list")
+
+    def probe():
+        response = parse_response(run_command(status_command, retry=False))
+        services_up = dict((name, False) for name in config.system_wait_services)
+        for service in response["service_states"]:
+            detail = service["service_detail"]
+            if isinstance(detail, dict) and detail.get("up"):
+                services_up[service["servicename"]] = True
+                record_time_to_ready(
+                    "service {0}".format(service["servicename"]),
+                    time.time() - started,
+                )
+        if not all(services_up.values()):
+            logger.debug("system_wait | services not yet up: %s", services_up)
+            return False
+        feeds_synced = dict((name, False) for name in config.system_wait_feeds)
+        if feeds_synced:
+            for feed in parse_response(run_command(feeds_command, retry=False)):
+                if feed["name"] in feeds_synced and feed.get("last_full_sync"):
+                    feeds_synced[feed["name"]] = True
+                    record_time_to_ready(
+                        "feed {0}".format(feed["name"]), time.time() - started
+                    )
+        if not all(feeds_synced.values()):
+            logger.debug("system_wait | feeds not yet synced: %s", feeds_synced)
+            return False
+        return True
 
-    command = assemble_command(
-        context, " system wait --timeout {0} --interval {1}".format(wait, interval)
-    )
-    try:
-        if log:
-            logger.debug("system_wait | running command {0}".format(command))
-            logger.info(
-                "system_wait | waiting for system to be available".format(image)
-            )
-        subprocess.run(command.split(), check=True, stdout=subprocess.PIPE)
+    if poll_until(probe, config.default_system_wait_timeout):
+        record_time_to_ready("system", time.time() - started)
         if log:
             log_results_simple(
                 "ok", "ok", "positive", "system_wait", "waited for system"
             )
-            logger.info("image_wait | finished")
-    except Exception as e:
-        if log:
-            logger.debug("system_wait | something went a bit wrong: {0}".format(e))
-            logger.info(
-                "system_wait | call failed; returning. Exception: {0}".format(e)
+            logger.info("system_wait | finished")
+        return True
+    if log:
+        logger.info(
+            "system_wait | call failed; returning. Timed out after {0}s".format(
+                config.default_system_wait_timeout
             )
-        return
+        )
+    return False
+
+
+def recently_ready(url):
+    """Whether a readiness probe against url succeeded within the last
+    config.readiness_cache_ttl seconds (see remember_ready)."""
+    try:
+        with open(config.readiness_cache_file) as f:
+            ready_at = json.load(f).get(url)
+    except (OSError, ValueError):
+        return False
+    return ready_at is not None and time.time() - ready_at < config.readiness_cache_ttl
+
+
+def remember_ready(url):
+    """Record that the system at url was just found ready."""
+    try:
+        with open(config.readiness_cache_file) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[url] = time.time()
+    with open(config.readiness_cache_file, "w") as f:
+        json.dump(cache, f)
 
 
 # /System
@@ -2250,6 +3327,8 @@ def system_wait(context, log=True):
 def registry(context):
     """Invoke the registry CLI subcommands."""
     logger.info("registry | starting subcommands")
+    from dotenv import load_dotenv
+
     load_dotenv()
     if (
         not os.getenv("REGISTRY_URL")
@@ -2279,11 +3358,9 @@ def registry_add(context):
         context, " registry add {0} {1} {2}".format(reg, reg_user, reg_token)
     )
     try:
-        logger.debug("registry_add | running command {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("registry_add | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         reg_name = response[0]["registry_name"]
         reg_type = response[0]["registry_type"]
         reg_user = response[0]["registry_user"]
@@ -2299,7 +3376,7 @@ def registry_add(context):
         )
     except Exception as e:
         if isinstance(e, subprocess.CalledProcessError):
-            response = json.loads(e.stdout)
+            response = parse_response(e)
             if response["message"] == "registry already exists in DB":
                 log_results_simple(
                     "ok",
@@ -2322,11 +3399,9 @@ def registry_get(context, test_type="positive"):
     reg = random.choice(config.registries)
     command = assemble_command(context, " registry get {0}".format(reg))
     try:
-        logger.debug("registry_get | running command {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("registry_get | running command %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         reg_name = response[0]["registry_name"]
         reg_type = response[0]["registry_type"]
         reg_user = response[0]["registry_user"]
@@ -2350,11 +3425,9 @@ def registry_list(context, test_type="positive"):
 
     command = assemble_command(context, " registry list")
     try:
-        logger.debug("registry_list | running command: {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
-        response = json.loads(completed_proc.stdout)
+        logger.debug("registry_list | running command: %s", command)
+        completed_proc = run_command(command)
+        response = parse_response(completed_proc)
         dump_response("registry_list", response)
         num_reg = len(response)
         for reg in response:
@@ -2386,10 +3459,8 @@ def registry_del(context, test_type="positive"):
     reg = os.getenv("REGISTRY_URL")
     command = assemble_command(context, " registry del {0}".format(reg))
     try:
-        logger.debug("registry_del | running command {0}".format(command))
-        completed_proc = subprocess.run(
-            command.split(), check=True, stdout=subprocess.PIPE
-        )
+        logger.debug("registry_del | running command %s", command)
+        completed_proc = run_command(command)
         # Like with repo_del: the API/CLI is returning a byte literal w/newline, like: b'true\n'
         response = bool(strtobool(completed_proc.stdout.decode("utf-8").rstrip()))
         dump_response("registry_del", response)
@@ -2415,50 +3486,1113 @@ def registry_del(context, test_type="positive"):
 
 # /Registry
 
-logger = make_logger()
-positive_tests = {"pass": [], "fail": []}
-negative_tests = {"pass": [], "fail": []}
+# Scheduler
+# A step of the `all` run. `requires` are steps that must have finished before
+# this one starts; `after` only orders this step behind others when they are
+# part of the same run.
+Step = namedtuple("Step", ["name", "func", "requires", "after"])
+
+SUITE = [
+    Step("account", account, [], []),
+    Step("image_add", image_add, [], []),
+    Step("image", image_checks, ["image_add"], []),
+    # archiving removes and restores images the image checks pick at random
+    Step("analysis_archive", analysis_archive, ["image_add"], ["image"]),
+    Step("evaluate", evaluate, ["image_add"], []),
+    Step("repo", repo, [], []),
+    Step("event", event, [], []),
+    Step("policy", policy, [], []),
+    # subscriptions are created by adding images and repos
+    Step("subscription", subscription, ["image_add"], ["repo"]),
+    # Note that system feeds subcommands are not tested here since they can
+    # take a long time; run system_feeds() explicitly for that
+    Step("system", system, [], []),
+    Step("registry", registry, [], []),
+    # deleting images must wait for everything that uses them
+    Step(
+        "image_deletion",
+        image_deletion,
+        ["image_add"],
+        ["image", "analysis_archive", "evaluate", "subscription"],
+    ),
+]
+
+
+# Checks `--rerun-failed` can run on their own, by the suite step they belong
+# to, with the steps or checks that must run before them. A failed check that
+# is not listed here reruns the whole step it failed in (e.g. the account
+# checks, which share generated accounts).
+RERUN_CHECKS = {
+    "image": [
+        Step("image_wait", image_wait, ["image_add"], []),
+        Step("image_get", image_get, ["image_add"], []),
+        Step("image_content", image_content_checks, ["image_add"], []),
+        Step("image_metadata", image_metadata, ["image_add"], []),
+        Step("image_list", image_list, ["image_add"], []),
+        Step("image_vuln", image_vuln, ["image_add"], []),
+    ],
+    "analysis_archive": [
+        Step(
+            "analysis_archive_images_add",
+            analysis_archive_images_add,
+            ["image_add"],
+            [],
+        ),
+        Step(
+            "analysis_archive_images_del",
+            analysis_archive_images_del,
+            ["analysis_archive_images_add"],
+            [],
+        ),
+    ],
+    "evaluate": [Step("evaluate_check", evaluate_check, ["image_add"], [])],
+    "repo": [
+        Step("repo_add", repo_add, [], []),
+        Step("repo_list", repo_list, ["repo_add"], []),
+        Step("repo_get", repo_get, ["repo_add"], []),
+        Step("repo_unwatch", repo_unwatch, ["repo_add"], []),
+        Step("repo_watch", repo_watch, ["repo_add"], ["repo_unwatch"]),
+        Step(
+            "repo_del", repo_del, ["repo_add"], ["repo_list", "repo_get", "repo_watch"]
+        ),
+    ],
+    "subscription": [
+        Step("subscription_list", subscription_list, ["image_add"], ["repo_add"]),
+        Step("subscription_activate", subscription_activate, ["image_add"], []),
+        Step(
+            "subscription_deactivate",
+            subscription_deactivate,
+            ["image_add"],
+            ["subscription_activate"],
+        ),
+    ],
+    "system": [
+        Step("system_status", system_status, [], []),
+        Step("system_errorcodes", system_errorcodes, [], []),
+    ],
+    "account": [Step("account_whoami", account_whoami, [], [])],
+}
+
+
+def failed_results(path):
+    """The failed (or timed out) results of a previous run, read from its
+    results file."""
+    failed = []
+    with open(path) as f:
+        for line in f:
+            result = json.loads(line)
+            if result["outcome"] in ["fail", "timeout"]:
+                failed.append(result)
+    return failed
+
+
+def rerun_steps(failed):
+    """The steps that rerun the failed checks, plus everything they require.
+
+    A suite step that runs after another one (image_deletion after image, say)
+    also runs after that step's checks when only those are rerun.
+    """
+    steps = dict((step.name, step) for step in SUITE)
+    checks = {}
+    members = collections.defaultdict(list)
+    for step_name, step_checks in RERUN_CHECKS.items():
+        for check in step_checks:
+            checks[check.name] = check
+            members[step_name].append(check.name)
+    wanted = []
+    for result in failed:
+        if result["name"] in checks:
+            wanted.append(checks[result["name"]])
+        elif result["name"] in steps:
+            wanted.append(steps[result["name"]])
+        elif result["step"] in steps:
+            wanted.append(steps[result["step"]])
+        else:
+            logger.warning(
+                "rerun | don't know how to rerun {0}; skipping".format(result["name"])
+            )
+    selected = {}
+    while wanted:
+        step = wanted.pop()
+        if step.name in selected:
+            continue
+        selected[step.name] = step
+        wanted.extend(checks.get(name) or steps[name] for name in step.requires)
+    rerun = []
+    for step in SUITE:
+        if step.name in selected:
+            after = step.after + [c for s in step.after for c in members[s]]
+            rerun.append(step._replace(after=after))
+        rerun.extend(checks[c] for c in members[step.name] if c in selected)
+    return rerun
+
+
+# Steps (and their rerun checks) that need the admin user; in a shard every
+# other step runs as the shard's own user
+ADMIN_STEPS = ["account", "system"]
+
+
+def step_context(step):
+    """A copy of the context a step runs with: the root (admin) context, or the
+    shard's user context when sharding and the step doesn't need the admin."""
+    admin_steps = ADMIN_STEPS + [
+        check.name for name in ADMIN_STEPS for check in RERUN_CHECKS.get(name, [])
+    ]
+    if shard_context and step.name not in admin_steps:
+        return copy.deepcopy(shard_context)
+    return copy.deepcopy(root_context)
+
+
+def parse_shard(value):
+    """Parse a `--shard i/n` value into (i, n), counting shards from 1."""
+    try:
+        index, count = [int(part) for part in value.split("/")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected i/n, e.g. 2/4: {0}".format(value))
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("shard {0} out of range".format(value))
+    return index, count
+
+
+def historical_durations(paths):
+    """Step durations from earlier runs' result summaries (the longest seen
+    wins when several are given); missing or unreadable files are skipped."""
+    durations = {}
+    for path in paths:
+        try:
+            with open(path) as f:
+                steps = json.load(f).get("steps", {})
+        except (OSError, ValueError) as e:
+            logger.debug("shard | no step durations from %s: %s", path, e)
+            continue
+        for name, seconds in steps.items():
+            durations[name] = max(seconds, durations.get(name, 0.0))
+    return durations
+
+
+def durations_digest(durations):
+    """A short digest of step durations; shards of one run must log the same."""
+    text = json.dumps(durations, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(text).hexdigest()[:12]
+
+
+def shard_output_file(path, shard):
+    """Where a run writes the output file configured as path: path itself, or
+    for a shard (index, count) a name with the shard in it, e.g.
+    cli_driver_results.shard-1-of-2.jsonl, so shards sharing a directory
+    don't overwrite each other's (or an unsharded run's) log, results,
+    reports and step durations."""
+    if not shard:
+        return path
+    base, ext = os.path.splitext(path)
+    return "{0}.shard-{1}-of-{2}{3}".format(base, shard[0], shard[1], ext)
+
+
+def shard_steps(steps, index, count, durations):
+    """The steps shard index (of count) runs, and the estimated seconds of
+    every shard.
+
+    Steps are dealt out longest first, each to the shard that would finish
+    earliest with it (longest-processing-time scheduling), where a step's cost
+    on a shard includes the prerequisites that shard doesn't run yet, since
+    every shard provisions its own images. Steps without a recorded duration
+    are assumed to take the average. Ties are broken by name and shard number,
+    so every shard computes the same partition from the same history.
+    """
+    by_name = dict((step.name, step) for step in steps)
+    known = [durations[name] for name in by_name if name in durations]
+    default = sum(known) / len(known) if known else 1.0
+
+    def cost(names):
+        return sum(durations.get(name, default) for name in names)
+
+    def closure(name):
+        names = set([name])
+        for required in by_name[name].requires:
+            names |= closure(required)
+        return names
+
+    shards = [set() for _ in range(count)]
+    loads = [0.0] * count
+    for step in sorted(steps, key=lambda step: (-cost([step.name]), step.name)):
+        needed = closure(step.name)
+        extra = [cost(needed - shard) for shard in shards]
+        best = min(range(count), key=lambda i: (loads[i] + extra[i], i))
+        loads[best] += extra[best]
+        shards[best] |= needed
+    return [step for step in steps if step.name in shards[index - 1]], loads
+
+
+def shard_setup(context, index, count):
+    """Create the shard's own account and user, so that the images, repos and
+    subscriptions it adds (and deletes) can't collide with another shard's."""
+    shard_context.update(provision_account(context))
+    logger.info(
+        "shard | shard {0}/{1} runs as {2} in account {3}".format(
+            index, count, shard_context["user"], shard_context["account_name"]
+        )
+    )
+
+
+def shard_teardown(context):
+    """Disable and delete the shard's account.
+
+    Like the setup this is not a check, so it records no results and a
+    shard's totals stay comparable with an unsharded run's.
+    """
+    name = shard_context["account_name"]
+    for args in [" account disable {0}", " account del --dontask {0}"]:
+        try:
+            run_command(assemble_command(context, args.format(name)))
+        except Exception as e:
+            logger.error("shard | could not tear down account {0}: {1}".format(name, e))
+            return
+
+
+def run_step(step):
+    """Run one step with its own copy of the root (or shard) context."""
+    logger.info("scheduler | starting step {0}".format(step.name))
+    started = time.time()
+    result_state.step = step.name
+    result_state.mark = started
+    try:
+        step.func(step_context(step))
+    except Exception as e:
+        log_explicit_failure(
+            "positive", step.name, "step raised an exception: {0}".format(e)
+        )
+    step_durations[step.name] = time.time() - started
+    logger.info(
+        "scheduler | finished step {0} in {1:.1f}s".format(
+            step.name, step_durations[step.name]
+        )
+    )
+
+
+def run_steps(steps, workers):
+    """Run steps on a bounded worker pool, honouring their dependencies.
+
+    A step is submitted as soon as everything it requires, and everything in
+    `after` that is part of this run, has finished.
+    """
+    names = set(step.name for step in steps)
+    for step in steps:
+        missing = [name for name in step.requires if name not in names]
+        if missing:
+            raise ValueError(
+                "step {0} requires {1}, which is not scheduled".format(
+                    step.name, ", ".join(missing)
+                )
+            )
+    pending = list(steps)
+    done = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while pending or running:
+            for step in list(pending):
+                waits_on = [n for n in step.requires + step.after if n in names]
+                if all(name in done for name in waits_on):
+                    pending.remove(step)
+                    running[executor.submit(run_step, step)] = step
+            if not running:
+                raise ValueError(
+                    "dependency cycle among steps: {0}".format(
+                        ", ".join(step.name for step in pending)
+                    )
+                )
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                done.add(running.pop(future).name)
+
+
+# /Scheduler
+
+# Load
+class LoadStats:
+    """Latencies and failures of load-mode operations, per check."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+
+    def record(self, name, elapsed, failed, missed=False):
+        with self.lock:
+            entry = self.operations.setdefault(
+                name, {"latencies": [], "errors": 0, "missed": 0}
+            )
+            entry["latencies"].append(elapsed)
+            if failed:
+                entry["errors"] += 1
+            if missed:
+                entry["missed"] += 1
+
+    def report(self, elapsed):
+        """Throughput, error rate and latency percentiles over elapsed seconds."""
+        with self.lock:
+            operations = {}
+            total = errors = missed = 0
+            everything = []
+            for name, entry in sorted(self.operations.items()):
+                count = len(entry["latencies"])
+                total += count
+                errors += entry["errors"]
+                missed += entry["missed"]
+                everything.extend(entry["latencies"])
+                operations[name] = {
+                    "count": count,
+                    "errors": entry["errors"],
+                    "missed_deadlines": entry["missed"],
+                    "error_rate": round(entry["errors"] / count, 4) if count else 0,
+                    "throughput": round(count / elapsed, 3) if elapsed else 0,
+                    "latency_ms": summarize_latencies(entry["latencies"]),
+                }
+        return {
+            "elapsed": round(elapsed, 3),
+            "operations_total": total,
+            "errors_total": errors,
+            "error_rate": round(errors / total, 4) if total else 0,
+            "missed_deadlines": missed,
+            "throughput": round(total / elapsed, 3) if elapsed else 0,
+            "latency_ms": summarize_latencies(everything),
+            "operations": operations,
+        }
+
+
+def provision_account(context):
+    """Create an account with its own user; returns the user's context."""
+    acct = fake_account_with_user()
+    account_add(context, acct["account_name"], acct["email"], log=False)
+    account_user_add(
+        context,
+        acct["account_name"],
+        acct["user"],
+        acct["passw"],
+        test_type="positive",
+        log=False,
+    )
+    user_context = copy.deepcopy(context)
+    user_context["user"] = acct["user"]
+    user_context["password"] = acct["passw"]
+    user_context["account_name"] = acct["account_name"]
+    return user_context
+
+
+def load_user_setup(context):
+    """Create an account with its own user, add the test images to it and wait
+    for them to be analyzed; returns the virtual user's context."""
+    user_context = provision_account(context)
+    # the adds are setup, not results of the run
+    start_load_operation()
+    try:
+        for image in config.test_images:
+            image_add_one(user_context, image)
+        ready = [
+            wait_for_image(user_context, image, "load") for image in config.test_images
+        ]
+    finally:
+        load_state.active = False
+    if load_state.failures or not all(ready):
+        logger.error(
+            "load | virtual user {0}: {1} of {2} images could not be added or "
+            "analyzed".format(
+                user_context["user"],
+                max(load_state.failures, ready.count(False)),
+                len(config.test_images),
+            )
+        )
+    logger.info("load | virtual user {0} ready".format(user_context["user"]))
+    return user_context
+
+
+def load_user_teardown(context, user_context):
+    """Disable and delete a virtual user's account."""
+    start_load_operation()
+    try:
+        account_disable(context, user_context["account_name"])
+        account_del(context, user_context["account_name"])
+    finally:
+        load_state.active = False
+    if load_state.failures:
+        logger.error(
+            "load | could not delete account {0}".format(user_context["account_name"])
+        )
+
+
+def start_load_operation():
+    """Count the results recorded on this thread from now on against a load
+    operation (until load_state.active is reset) instead of recording them."""
+    load_state.active = True
+    load_state.failures = 0
+    load_state.passes = 0
+
+
+def run_operation(user_context, name, func, intended=None):
+    """Run one load-mode check, counting its failures instead of recording them;
+    a check that records no passing result counts as failed.
+
+    With an intended send time (open-loop mode) latency is measured from that
+    time rather than from when the check actually started, so queueing behind
+    slow calls is charged to the engine instead of hidden; a start later than
+    config.load_deadline_slack after it counts as a missed deadline.
+    """
+    start_load_operation()
+    started = time.time()
+    missed = False
+    if intended is not None:
+        missed = started - intended > config.load_deadline_slack
+        started = intended
+    try:
+        func(user_context)
+    except Exception as e:
+        logger.error("load | {0} raised an exception: {1}".format(name, e))
+        load_state.failures += 1
+    finally:
+        load_state.active = False
+    # a check that gave up early (e.g. its image never became ready) records
+    # nothing, which is a failure too
+    failed = load_state.failures > 0 or not load_state.passes
+    load_stats.record(name, time.time() - started, failed, missed)
+
+
+def load_operations():
+    """The weighted mix of checks as (names, weights, functions)."""
+    names = list(config.load_mix)
+    weights = [config.load_mix[name] for name in names]
+    funcs = [getattr(sys.modules[__name__], name) for name in names]
+    return names, weights, funcs
+
+
+def load_user_loop(user_context, deadline):
+    """One virtual user: run weighted random checks back to back until deadline."""
+    names, weights, funcs = load_operations()
+    while time.time() < deadline:
+        index = random.choices(range(len(names)), weights)[0]
+        run_operation(user_context, names[index], funcs[index])
+
+
+def load_open_loop(user_contexts, rate, deadline):
+    """Issue weighted random checks at a constant rate until deadline.
+
+    Operations are started on a timer, one every 1/rate seconds, whether or not
+    earlier ones have completed (up to config.load_max_outstanding at a time;
+    beyond that they queue and miss their deadline). Virtual users take turns.
+    """
+    names, weights, funcs = load_operations()
+    started = time.time()
+    sent = 0
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=config.load_max_outstanding
+    ) as executor:
+        while True:
+            intended = started + sent / rate
+            if intended >= deadline:
+                break
+            delay = intended - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            index = random.choices(range(len(names)), weights)[0]
+            executor.submit(
+                run_operation,
+                user_contexts[sent % len(user_contexts)],
+                names[index],
+                funcs[index],
+                intended,
+            )
+            sent += 1
+    logger.info("load | issued {0} operations at {1}/s".format(sent, rate))
+
+
+def log_load_report(report):
+    logger.info("==============================")
+    logger.info(
+        "Load Summary: {0} operations in {1}s; {2} ops/s; error rate {3}; "
+        "{4} missed deadlines".format(
+            report["operations_total"],
+            report["elapsed"],
+            report["throughput"],
+            report["error_rate"],
+            report["missed_deadlines"],
+        )
+    )
+    for name, entry in report["operations"].items():
+        latency = entry["latency_ms"]
+        logger.info(
+            "\t{0:<20} n={1} ops/s={2} errors={3} missed={4} p50={5} p95={6} "
+            "p99={7} max={8}".format(
+                name,
+                entry["count"],
+                entry["throughput"],
+                entry["errors"],
+                entry["missed_deadlines"],
+                latency.get("p50"),
+                latency.get("p95"),
+                latency.get("p99"),
+                latency.get("max"),
+            )
+        )
+
+
+def load(context, users=None, duration=None, rate=None):
+    """Drive the engine with concurrent virtual users for a fixed duration.
+
+    Every virtual user gets its own account, user and images, then loops over
+    a weighted mix of checks (config.load_mix) until the duration is up. With
+    a rate (operations per second) the checks are instead issued open-loop at
+    that constant rate, shared between the virtual users.
+    """
+    users = users or config.load_users
+    duration = duration or config.load_duration
+    logger.info("load | setting up {0} virtual users".format(users))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=users) as executor:
+        user_contexts = list(
+            executor.map(lambda _: load_user_setup(context), range(users))
+        )
+    logger.info("load | running for {0}s".format(duration))
+    started = time.time()
+    deadline = started + duration
+    if rate:
+        load_open_loop(user_contexts, rate, deadline)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=users) as executor:
+            list(executor.map(lambda uc: load_user_loop(uc, deadline), user_contexts))
+    report = load_stats.report(time.time() - started)
+    report["users"] = users
+    report["offered_rate"] = rate
+    log_load_report(report)
+    with open(config.load_report_file, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info("load | wrote load report to {0}".format(config.load_report_file))
+    for user_context in user_contexts:
+        load_user_teardown(context, user_context)
+
+
+# /Load
+
+
+# Benchmark
+def benchmark_images(count):
+    """The image references the benchmark submits: the first count of
+    config.benchmark_images, or count generated ones if that list is empty."""
+    if config.benchmark_images:
+        return config.benchmark_images[:count]
+    return [config.benchmark_image_template.format(n) for n in range(count)]
+
+
+class AnalysisThroughput:
+    """Analysis progress of bulk-submitted images, one `image list` poll at a time.
+
+    Keeps when each image was submitted and when it was first seen in each
+    analysis state, and the backlog (images submitted but not yet analyzed or
+    failed) at every poll.
+    """
+
+    terminal_states = ["analyzed", "analysis_failed"]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.submitted = {}
+        self.submit_errors = 0
+        self.seen = {}
+        self.samples = []
+
+    def submit(self, image, started):
+        with self.lock:
+            self.submitted[normalize_image(image)] = started
+
+    def submit_failed(self):
+        with self.lock:
+            self.submit_errors += 1
+
+    def observe(self, statuses, ts):
+        """Record one poll (statuses maps tags to analysis status, as from
+        image_statuses); returns the backlog."""
+        with self.lock:
+            counts = collections.Counter()
+            for image in self.submitted:
+                # not listed yet counts as queued
+                status = statuses.get(image, "not_analyzed")
+                self.seen.setdefault(image, {}).setdefault(status, ts)
+                counts[status] += 1
+            backlog = len(self.submitted) - sum(
+                counts[status] for status in self.terminal_states
+            )
+            sample = {"ts": round(ts, 3), "submitted": len(self.submitted)}
+            sample["backlog"] = backlog
+            sample.update(counts)
+            self.samples.append(sample)
+            return backlog
+
+    def report(self):
+        """Drain rate, time-to-analyzed percentiles and peak backlog."""
+        with self.lock:
+            to_start = []
+            to_done = []
+            done_at = []
+            failed = 0
+            for image, submitted in self.submitted.items():
+                seen = self.seen.get(image, {})
+                if "analyzing" in seen:
+                    to_start.append(seen["analyzing"] - submitted)
+                if "analysis_failed" in seen:
+                    failed += 1
+                    done_at.append(seen["analysis_failed"])
+                elif "analyzed" in seen:
+                    to_done.append(seen["analyzed"] - submitted)
+                    done_at.append(seen["analyzed"])
+            samples = list(self.samples)
+            submitted = len(self.submitted)
+            submit_errors = self.submit_errors
+            first = min(self.submitted.values()) if self.submitted else None
+        peak = max(samples, key=lambda sample: sample["backlog"], default=None)
+        report = {
+            "submitted": submitted,
+            "submit_errors": submit_errors,
+            "analyzed": len(to_done),
+            "failed": failed,
+            "unfinished": samples[-1]["backlog"] if samples else 0,
+            "peak_backlog": peak["backlog"] if peak else 0,
+            "time_to_analyzing_s": summarize_seconds(to_start),
+            "time_to_analyzed_s": summarize_seconds(to_done),
+        }
+        # images finished per minute over the whole run, and while draining
+        # the backlog from its peak to the last poll
+        report["throughput_per_min"] = None
+        if done_at and max(done_at) > first:
+            report["throughput_per_min"] = round(
+                len(done_at) / (max(done_at) - first) * 60, 2
+            )
+        report["drain_rate_per_min"] = None
+        if peak and samples[-1]["ts"] > peak["ts"]:
+            report["drain_rate_per_min"] = round(
+                (peak["backlog"] - samples[-1]["backlog"])
+                / (samples[-1]["ts"] - peak["ts"])
+                * 60,
+                2,
+            )
+        report["samples"] = samples
+        return report
+
+
+def summarize_seconds(values):
+    """count/min/p50/p90/p95/p99/max of a list of durations, in seconds."""
+    values = sorted(values)
+    summary = {"count": len(values)}
+    if values:
+        summary["min"] = round(values[0], 3)
+        for pct in [50, 90, 95, 99]:
+            summary["p{0}".format(pct)] = round(percentile(values, pct), 3)
+        summary["max"] = round(values[-1], 3)
+    return summary
+
+
+def log_benchmark_report(report):
+    logger.info("==============================")
+    logger.info(
+        "Benchmark Summary: {0} images submitted ({1} errors) in {2}s; {3} "
+        "analyzed, {4} failed, {5} unfinished".format(
+            report["submitted"],
+            report["submit_errors"],
+            report["elapsed"],
+            report["analyzed"],
+            report["failed"],
+            report["unfinished"],
+        )
+    )
+    logger.info(
+        "\tthroughput {0}/min; drain rate {1}/min; peak backlog {2}".format(
+            report["throughput_per_min"],
+            report["drain_rate_per_min"],
+            report["peak_backlog"],
+        )
+    )
+    for name in ["time_to_analyzing_s", "time_to_analyzed_s"]:
+        summary = report[name]
+        logger.info(
+            "\t{0:<20} n={1} p50={2} p90={3} p95={4} p99={5} max={6} (+/- {7}s)".format(
+                name,
+                summary["count"],
+                summary.get("p50"),
+                summary.get("p90"),
+                summary.get("p95"),
+                summary.get("p99"),
+                summary.get("max"),
+                report["poll_interval"],
+            )
+        )
+
+
+def benchmark(context, count=None):
+    """Measure the engine's analysis throughput.
+
+    Bulk-submits count images (config.benchmark_count by default) to a fresh
+    account with config.benchmark_submit_workers concurrent `image add`s while
+    a single `image list` every config.benchmark_poll_interval seconds follows
+    the analysis state of all of them, until none is left in the backlog or
+    config.benchmark_timeout passes. Times are as observed by the polls, so
+    they are accurate to a poll interval.
+    """
+    images = benchmark_images(count or config.benchmark_count)
+    user_context = provision_account(context)
+    throughput = AnalysisThroughput()
+
+    def submit(image):
+        started = time.time()
+        try:
+            run_command(assemble_command(user_context, " image add {0}".format(image)))
+            throughput.submit(image, started)
+        except Exception as e:
+            throughput.submit_failed()
+            logger.error("benchmark | could not add image {0}: {1}".format(image, e))
+
+    logger.info(
+        "benchmark | submitting {0} images as {1}".format(
+            len(images), user_context["user"]
+        )
+    )
+    started = time.time()
+    deadline = started + config.benchmark_timeout
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=config.benchmark_submit_workers
+    )
+    futures = [executor.submit(submit, image) for image in images]
+    executor.shutdown(wait=False)
+    command = assemble_command(user_context, " image list")
+    while True:
+        # decided before polling, so a finished submission is in the poll
+        submitting = not all(future.done() for future in futures)
+        ts = time.time()
+        try:
+            proc = run_command(command, retry=False)
+            backlog = throughput.observe(image_statuses(proc), ts)
+        except Exception as e:
+            logger.warning("benchmark | error polling images: {0}".format(e))
+            backlog = None
+        if backlog == 0 and not submitting:
+            break
+        if ts > deadline:
+            logger.error(
+                "benchmark | gave up after {0}s with {1} images in the backlog".format(
+                    config.benchmark_timeout, backlog
+                )
+            )
+            break
+        logger.debug("benchmark | backlog: %s", backlog)
+        time.sleep(config.benchmark_poll_interval)
+    # submissions still queued after a timeout are dropped, not waited for
+    for future in futures:
+        future.cancel()
+    executor.shutdown(wait=True)
+
+    report = throughput.report()
+    report["elapsed"] = round(time.time() - started, 3)
+    report["poll_interval"] = config.benchmark_poll_interval
+    report["submit_workers"] = config.benchmark_submit_workers
+    log_benchmark_report(report)
+    with open(config.benchmark_report_file, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(
+        "benchmark | wrote benchmark report to {0}".format(config.benchmark_report_file)
+    )
+    load_user_teardown(context, user_context)
+
+
+# /Benchmark
+
+logger, log_listener = make_logger()
+results_lock = threading.Lock()
+results = ResultStore(config.results_file)
+result_state = threading.local()
+step_durations = dict()
+ready_times = dict()
+response_cache = ResponseCache(config.response_cache_size)
+command_stats = CommandStats()
+circuit_breaker = CircuitBreaker(
+    config.circuit_breaker_threshold, config.circuit_breaker_reset_timeout
+)
+load_stats = LoadStats()
+load_state = threading.local()
+# jitter has its own generator so polling threads don't disturb seeded choices
+jitter_random = random.Random()
+image_trackers = dict()
+trackers_lock = threading.Lock()
 root_context = dict()
+shard_context = dict()
+identity_pool = IdentityPool(config.identity_batch_size, config.identity_seed)
 
 cmd_prefix = config.cmd_prefix
 api_url = config.local_url
+transport_name = config.transport
 if os.path.isfile("CLI"):
     api_url = config.ci_url
     cmd_prefix = config.cli_command_prefix + config.cmd_prefix
+    transport_name = config.cli_transport
+
+transport = make_transport(os.getenv("CLI_DRIVER_TRANSPORT", transport_name), config)
+
+
+def start_mock_engine():
+    """Start the bundled mock engine API in-process; returns the server."""
+    import mock_engine
+
+    server = mock_engine.serve(
+        admin_user=config.default_admin_user,
+        admin_password=config.default_admin_pass,
+        latency=config.mock_latency,
+        jitter=config.mock_jitter,
+        analysis_time=config.mock_analysis_time,
+        analyzers=config.mock_analyzers,
+        packages=config.mock_packages,
+        vulnerabilities=config.mock_vulnerabilities,
+        seed=config.mock_seed,
+    )
+    logger.info("main | started mock engine at {0}".format(server.url))
+    return server
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Drive anchore-cli end to end tests")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="all",
+        help="top level subcommand, check function, load or benchmark to run; "
+        "default: all",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.max_workers,
+        help="number of steps of the `all` run to execute concurrently",
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=config.load_users,
+        help="number of concurrent virtual users in load mode",
+    )
+    parser.add_argument(
+        "--duration",
+        type=int,
+        default=config.load_duration,
+        help="seconds to run load mode for",
+    )
+    parser.add_argument(
+        "--images",
+        type=int,
+        default=config.benchmark_count,
+        help="number of images the benchmark submits",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="issue load-mode checks open-loop at this many per second",
+    )
+    parser.add_argument(
+        "--skip-wait",
+        action="store_true",
+        help="don't wait for the system to be ready before running",
+    )
+    parser.add_argument(
+        "--mock",
+        action="store_true",
+        help="run against a local mock engine instead of a real one",
+    )
+    parser.add_argument(
+        "--record",
+        nargs="?",
+        const=config.cassette_file,
+        metavar="CASSETTE",
+        help="record every command and response to a cassette",
+    )
+    parser.add_argument(
+        "--replay",
+        nargs="?",
+        const=config.cassette_file,
+        metavar="CASSETTE",
+        help="serve every command from a recorded cassette instead of an engine",
+    )
+    parser.add_argument(
+        "--rerun-failed",
+        nargs="?",
+        const=config.results_file,
+        metavar="RESULTS",
+        help="rerun only the checks that failed in a previous run, and what "
+        "they require",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=config.profile_file,
+        metavar="COLLAPSED",
+        help="sample the driver's stacks and report where its time goes",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="run only shard I of N of the steps, in an account of its own",
+    )
+    parser.add_argument(
+        "--shard-history",
+        action="append",
+        metavar="SUMMARY",
+        help="result summary of an earlier run whose step durations balance the "
+        "shards (required with --shard); may be repeated, e.g. once per shard "
+        "summary of the previous run. Every shard must read the same files, so "
+        "don't point it at summaries the shards of this run write",
+    )
+    args = parser.parse_args(argv)
+    if args.shard and not args.shard_history:
+        # every shard must partition the steps from the same durations, and a
+        # default file in a shared directory may change between shards
+        parser.error("--shard requires --shard-history")
+    return args
+
+
+def use_cassette(args):
+    """Wrap the transport for --record, or replace it for --replay, and seed the
+    random choices (images, repos, fake accounts) the way the cassette was."""
+    global transport
+    if args.replay:
+        transport = ReplayTransport(args.replay)
+        seed = transport.seed
+        # nothing analyzes or syncs during a replay; don't wait between polls
+        config.wait_initial_interval = 0
+        config.wait_max_interval = 0
+        logger.info("main | replaying {0} (seed {1})".format(args.replay, seed))
+    else:
+        seed = random.randrange(2**32)
+        transport = RecordingTransport(transport, args.record, seed)
+        logger.info("main | recording to {0} (seed {1})".format(args.record, seed))
+    random.seed(seed)
+    identity_pool.seed(seed)
+    # steps running concurrently would draw from the seeded generator in a
+    # different order every run, so cassette runs are sequential
+    args.workers = 1
 
 
 def run_cli_driver():
+    args = parse_args(sys.argv[1:])
+    started = time.time()
+    if args.shard:
+        # every output of a shard gets a name of its own, and a shard reruns
+        # its own failures by default
+        move_log_file(shard_output_file(LOG_FILE, args.shard))
+        results.path = shard_output_file(config.results_file, args.shard)
+        if args.rerun_failed == config.results_file:
+            args.rerun_failed = results.path
+    profiler = None
+    if args.profile:
+        profiler = cli_driver_profile.SamplingProfiler(
+            config.profile_interval, profile_label
+        )
+        profiler.start()
+    if args.record or args.replay:
+        use_cassette(args)
 
     root_context["user"] = config.default_admin_user
     root_context["password"] = config.default_admin_pass
     root_context["api_url"] = api_url
+    mock_server = None
+    if args.mock:
+        mock_server = start_mock_engine()
+        root_context["api_url"] = mock_server.url
     context = copy.deepcopy(root_context)
 
-    # Wait for the system to be up and ready before doing anything else
-    logger.info("main | Waiting for system to be ready")
-    system_wait(context, False)
+    # Wait for the system to be up and ready before doing anything else, unless
+    # asked not to or it was found ready moments ago (cassette runs always
+    # wait, so recordings and replays issue the same commands)
+    cassette = args.record or args.replay
+    if args.skip_wait:
+        logger.info("main | Not waiting for system to be ready")
+    elif not cassette and recently_ready(context["api_url"]):
+        logger.info(
+            "main | System was ready less than {0}s ago; not waiting".format(
+                config.readiness_cache_ttl
+            )
+        )
+    else:
+        logger.info("main | Waiting for system to be ready")
+        if system_wait(context, False) and not cassette:
+            remember_ready(context["api_url"])
+
+    # Sample the engine's health while the checks run (not during cassette
+    # runs: its commands would interleave with theirs differently every time)
+    health = None
+    if config.health_interval and not cassette:
+        health = HealthSampler(
+            root_context,
+            shard_output_file(config.health_file, args.shard),
+            config.health_interval,
+        )
+        health.start()
 
     # Figure out which top level CLI command is being called, then call it
-    command = sys.argv[1] if len(sys.argv) == 2 else "all"
-    if command == "all":
-        account(context)
-        context = copy.deepcopy(root_context)
-        image(context)
-        analysis_archive(context)
-        image_deletion(context)
-        evaluate(context)
-        repo(context)
-        event(context)
-        policy(context)
-        subscription(context)
-        # Note that system feeds subcommands are not tested here since they can
-        # take a long time; run system_feeds() explicitly for that
-        system(context)
-        registry(context)
+    if args.rerun_failed or args.command == "all":
+        steps = SUITE
+        if args.rerun_failed:
+            failed = failed_results(args.rerun_failed)
+            steps = rerun_steps(failed)
+            logger.info(
+                "main | rerunning {0} failed results with steps: {1}".format(
+                    len(failed), ", ".join(step.name for step in steps) or "nothing"
+                )
+            )
+        if args.shard:
+            index, count = args.shard
+            durations = historical_durations(args.shard_history)
+            logger.info(
+                "main | shard {0}/{1} balances {2} step durations (digest {3}) "
+                "from {4}; every shard must log the same digest".format(
+                    index,
+                    count,
+                    len(durations),
+                    durations_digest(durations),
+                    ", ".join(args.shard_history),
+                )
+            )
+            steps, loads = shard_steps(steps, index, count, durations)
+            logger.info(
+                "main | shard {0}/{1} runs {2} (estimated {3:.1f}s; all shards: "
+                "{4})".format(
+                    index,
+                    count,
+                    ", ".join(step.name for step in steps) or "nothing",
+                    loads[index - 1],
+                    ", ".join("{0:.1f}s".format(load) for load in loads),
+                )
+            )
+            shard_setup(context, index, count)
+        try:
+            run_steps(steps, args.workers)
+        finally:
+            if args.shard:
+                shard_teardown(context)
+    elif args.command == "load":
+        load(context, args.users, args.duration, args.rate)
+    elif args.command == "benchmark":
+        benchmark(context, args.images)
     else:
-        func = getattr(sys.modules[__name__], command)
+        func = getattr(sys.modules[__name__], args.command)
         func(context)
 
+    if health:
+        health.stop()
+    transport.close()
+    if getattr(transport, "misses", 0):
+        logger.warning(
+            "main | {0} commands were not in the cassette".format(transport.misses)
+        )
+    if mock_server:
+        mock_server.shutdown()
+    if profiler:
+        profiler.stop()
+        log_profile(profiler, shard_output_file(args.profile, args.shard))
+    write_timings_report(shard_output_file(config.timings_file, args.shard), health)
+    write_result_reports(time.time() - started, args.shard)
     log_results_summary()
 
 
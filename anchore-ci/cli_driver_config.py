@@ -3,17 +3,203 @@
 # Useful for debugging - set to True
 dump_responses = False
 
+# cli_driver.log gets records at log_file_level and up ("INFO" skips the
+# per-command debug lines); set log_max_bytes to rotate it at that size,
+# keeping log_backup_count old logs
+log_file_level = "DEBUG"
+log_max_bytes = 0
+log_backup_count = 5
+
 default_admin_user = "admin"
 
 default_admin_pass = "foobar"
 
+# Number of steps of the `all` run executed concurrently (see SUITE in
+# cli_driver.py); 1 runs them one after the other
+max_workers = 4
+
 default_system_wait_timeout = 300
 default_system_wait_interval = 10
 
+# Services and feeds that must be ready before the driver starts (the same
+# defaults as `anchore-cli system wait`)
+system_wait_services = ["catalog", "apiext", "policy_engine", "simplequeue", "analyzer"]
+system_wait_feeds = ["vulnerabilities"]
+
+# A successful readiness check at startup is remembered in readiness_cache_file
+# for readiness_cache_ttl seconds, during which later runs against the same
+# api_url start without waiting (use --skip-wait to never wait)
+readiness_cache_file = ".cli_driver_ready.json"
+readiness_cache_ttl = 60
+
+# System and image readiness is polled adaptively: the first poll waits
+# wait_initial_interval seconds, and every later one waits wait_backoff_factor
+# times longer (+/- wait_jitter), up to wait_max_interval
+wait_initial_interval = 0.5
+wait_backoff_factor = 1.5
+wait_jitter = 0.2
+wait_max_interval = default_system_wait_interval
+
+# Images are added concurrently; the analysis status of every added image is
+# then followed by one poller (`image list`) that checks block on
+image_add_workers = 8
+image_wait_timeout = 3600
+
+# Deadline in seconds for a single command, by subcommand: a "family verb"
+# entry wins over its "family" entry, and "default" covers everything else. A
+# command still running at its deadline is killed together with everything it
+# started, and the check it belongs to records a timeout (not enforced by the
+# inprocess transport)
+command_timeouts = {
+    "default": 120,
+    "image wait": image_wait_timeout,
+    "system wait": default_system_wait_timeout,
+    "system feeds": 1800,
+}
+
+# A command that fails transiently (a connection error, a 5xx from an engine
+# or a proxy in front of it restarting, a service not ready yet) is retried up
+# to retry_attempts times, waiting from retry_initial_interval up to
+# retry_max_interval seconds (jittered) in between. 4xx responses are never
+# retried, and writes are only retried on failures that mean the engine never
+# saw them (the retry_write_* lists)
+retry_attempts = 3
+retry_initial_interval = 1
+retry_max_interval = 10
+retry_http_codes = [502, 503, 504]
+retry_messages = [
+    "Connection refused",
+    "Connection reset",
+    "Connection aborted",
+    "RemoteDisconnected",
+    "Max retries exceeded",
+    "Bad Gateway",
+    "Service Unavailable",
+    "Gateway Timeout",
+    "not ready",
+]
+retry_write_http_codes = [502, 503]
+retry_write_messages = [
+    "Connection refused",
+    "Bad Gateway",
+    "Service Unavailable",
+    "not ready",
+]
+
+# After circuit_breaker_threshold transient failures in a row against an
+# engine, its commands fail fast (without being sent) for
+# circuit_breaker_reset_timeout seconds before one is let through to probe it
+circuit_breaker_threshold = 5
+circuit_breaker_reset_timeout = 30
+
 cmd_prefix = "anchore-cli --json "
 
 cli_command_prefix = "kubectl exec anchore-cli -- "
 
+# How commands are executed: "subprocess" runs anchore-cli once per command,
+# "inprocess" imports anchorecli once and invokes it inside the driver, and
+# "http" calls the engine API directly over pooled keep-alive connections.
+# Override with the CLI_DRIVER_TRANSPORT environment variable.
+transport = "subprocess"
+
+# Transport used when the CLI marker file is present (anchore-cli runs in the
+# cluster). "session" keeps a shell open in the anchore-cli pod and sends every
+# command over it instead of starting a new `kubectl exec` per command.
+cli_transport = "session"
+
+# Shell started by the session transport, and how many to keep open at once
+cli_session_command = "kubectl exec -i anchore-cli -- sh"
+cli_session_pool_size = max_workers
+
+# Socket timeout (seconds) for the http transport
+http_timeout = 60
+
+# Number of read-only responses kept for helpers that only need data (picking
+# a random image, feed or subscription); 0 disables the cache
+response_cache_size = 256
+
+# Per-subcommand latency report, written next to cli_driver.log
+timings_file = "cli_driver_timings.json"
+
+# While the checks run, `system status` and `system feeds list` are sampled
+# every health_interval seconds (0 disables it) and recorded, timestamped, in
+# health_file next to the timings, so latency spikes can be lined up with
+# service restarts and feed syncs
+health_file = "cli_driver_health.jsonl"
+health_interval = 10
+
+# Every test result, one JSON record per line, written as the run goes
+results_file = "cli_driver_results.jsonl"
+
+# Reports written from those results at the end of a run: JUnit XML (testcase
+# times are the measured durations) and a JSON summary listing the
+# report_slowest slowest checks
+junit_file = "cli_driver_junit.xml"
+summary_file = "cli_driver_summary.json"
+report_slowest = 10
+
+# `--profile` samples every thread's stack every profile_interval seconds and
+# writes them to profile_file as collapsed stacks (for flamegraph.pl), then
+# logs the time by subcommand and category and the profile_top top functions
+profile_file = "cli_driver_profile.collapsed"
+profile_interval = 0.01
+profile_top = 20
+
+# Load mode (`cli_driver.py load`): virtual users, each with its own account,
+# loop over a weighted mix of checks for a fixed number of seconds
+load_users = 4
+load_duration = 300
+load_mix = {
+    "image_get": 20,
+    "image_list": 20,
+    "image_vuln": 20,
+    "image_metadata": 10,
+    "image_content": 10,
+    "evaluate_check": 10,
+    "subscription_list": 5,
+    "repo_list": 5,
+}
+
+# Open-loop load (`load --rate R`): checks allowed in flight at once, and how
+# late (seconds) a check may start before it counts as a missed deadline
+load_max_outstanding = 64
+load_deadline_slack = 0.1
+load_report_file = "cli_driver_load.json"
+
+# Analysis throughput benchmark (`cli_driver.py benchmark --images N`): the
+# images submitted are the first N of benchmark_images, or if that is empty N
+# generated from benchmark_image_template (push those tags to a local registry,
+# or use --mock, which accepts any image). They are added benchmark_submit_workers
+# at a time and followed with one `image list` every benchmark_poll_interval
+# seconds for up to benchmark_timeout seconds
+benchmark_count = 100
+benchmark_images = []
+benchmark_image_template = "localhost:5000/cli-driver-benchmark:{0}"
+benchmark_submit_workers = 8
+benchmark_poll_interval = 2
+benchmark_timeout = image_wait_timeout
+benchmark_report_file = "cli_driver_benchmark.json"
+
+# Fake accounts, users, emails and passwords are generated this many at a
+# time; set identity_seed to an integer to get the same ones every run
+identity_batch_size = 32
+identity_seed = None
+
+# Default cassette for `--record` and `--replay`
+cassette_file = "cli_driver.cassette.jsonl.gz"
+
+# Mock engine (`cli_driver.py --mock`): a local stand-in for the engine API,
+# with a fixed latency (+ up to jitter) per request, the seconds an added image
+# takes to be analyzed (by one of mock_analyzers analyzers, the rest queueing;
+# 0 for no queue), and how much package and vulnerability data per image
+mock_latency = 0.0
+mock_jitter = 0.0
+mock_analysis_time = 2.0
+mock_analyzers = 0
+mock_packages = 100
+mock_vulnerabilities = 50
+mock_seed = 0
+
 local_url = "http://localhost:8228/v1"
 
 ci_url = "http://e2e-testing-anchore-engine-api:8228/v1"
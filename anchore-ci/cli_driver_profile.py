@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""A sampling profiler that attributes cli_driver time to what it was spent on.
+
+Every interval the stacks of all threads are sampled with sys._current_frames().
+Each sample is attributed to a label (cli_driver labels samples with the
+anchore-cli subcommand being run, or the step) and to a category:
+
+    spawn   starting an anchore-cli process
+    wait    waiting on a command, the engine or a sleep between polls
+    parse   decoding JSON output
+    log     formatting and writing log records
+    cli     anchore-cli itself, when it runs in-process
+    engine  the mock engine, when it runs in-process
+    driver  everything else the driver does
+
+Threads that are idle (waiting with nothing to attribute it to) are not counted.
+"""
+
+import collections
+import linecache
+import os
+import sys
+import threading
+import time
+
+CATEGORIES = ["driver", "spawn", "wait", "parse", "log", "cli", "engine"]
+
+# frames of the driver that decode command output
+PARSE_FUNCTIONS = set(["parse_response", "scan_response", "stream_chunks"])
+PARSE_FUNCTIONS.update(["fill", "peek", "expect", "value"])
+
+# standard library modules a thread blocks in while it waits
+WAIT_MODULES = set(["socket", "selectors", "ssl", "threading", "queue"])
+WAIT_MODULES.update(["subprocess", "client"])
+
+# functions that block in a call without a frame of its own (the log
+# listener's SimpleQueue.get)
+BLOCKING_FUNCTIONS = set(["dequeue"])
+
+# subprocess functions that start a process rather than wait for one
+SPAWN_FUNCTIONS = set(["__init__", "_execute_child", "_get_handles"])
+
+
+def frame_name(code):
+    """A frame in a collapsed stack, e.g. cli_driver.py:run_command."""
+    return "{0}:{1}".format(os.path.basename(code.co_filename), code.co_name)
+
+
+def categorize(frame, stack):
+    """The category of a sample; stack is its code objects, leaf first."""
+    # a sleep has no frame of its own either; it shows as the line calling it
+    line = linecache.getline(frame.f_code.co_filename, frame.f_lineno)
+    if "sleep(" in line or frame.f_code.co_name in BLOCKING_FUNCTIONS:
+        return "wait"
+    for code in stack:
+        filename = code.co_filename
+        module = os.path.splitext(os.path.basename(filename))[0]
+        if module == "mock_engine":
+            return "engine"
+        if "anchorecli" in filename:
+            return "cli"
+        if os.sep + "logging" + os.sep in filename:
+            return "log"
+        if os.sep + "json" + os.sep in filename:
+            return "parse"
+        if module.startswith("cli_driver") and code.co_name in PARSE_FUNCTIONS:
+            return "parse"
+        if module == "subprocess" and code.co_name in SPAWN_FUNCTIONS:
+            return "spawn"
+        if module in WAIT_MODULES:
+            return "wait"
+    return "driver"
+
+
+class SamplingProfiler:
+    """Sample every thread's stack every interval seconds.
+
+    label(frame) is asked for a label for each frame of a stack, innermost
+    first; the first one it returns is the label of the sample.
+    """
+
+    def __init__(self, interval=0.01, label=None):
+        self.interval = interval
+        self.label = label
+        self.samples = collections.Counter()
+        self.ticks = 0
+        self.sampling_time = 0.0
+        self.started = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.time() - self.started
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            started = time.time()
+            self.sample(me)
+            self.sampling_time += time.time() - started
+            self.ticks += 1
+
+    def sample(self, me):
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            label = None
+            stack = []
+            current = frame
+            while current is not None:
+                if label is None and self.label:
+                    label = self.label(current)
+                stack.append(current.f_code)
+                current = current.f_back
+            category = categorize(frame, stack)
+            if label is None and category == "wait":
+                # an idle thread
+                continue
+            self.samples[(label or "(other)", category, tuple(stack))] += 1
+
+    @property
+    def sample_seconds(self):
+        """The wall time one sample stands for."""
+        return self.elapsed / self.ticks if self.ticks else self.interval
+
+    def write_collapsed(self, path):
+        """Write the samples as collapsed stacks (one "frame;frame;... count"
+        line per stack, root first), with the label and category as the two
+        outermost frames, for flamegraph.pl or speedscope."""
+        with open(path, "w") as f:
+            for (label, category, stack), count in sorted(
+                self.samples.items(), key=lambda item: -item[1]
+            ):
+                frames = [label, category]
+                frames.extend(frame_name(code) for code in reversed(stack))
+                f.write("{0} {1}\n".format(";".join(frames), count))
+
+    def report(self, top=20):
+        """Lines of a table of thread-seconds by label and category, and of the
+        top functions by time spent in them (self) and under them (total)."""
+        seconds = self.sample_seconds
+        by_label = collections.defaultdict(collections.Counter)
+        own = collections.Counter()
+        under = collections.Counter()
+        for (label, category, stack), count in self.samples.items():
+            by_label[label][category] += count
+            own[stack[0]] += count
+            for code in set(stack):
+                under[code] += count
+
+        lines = [
+            "{0} samples every {1:.0f}ms over {2:.1f}s; sampling took {3:.1f}s".format(
+                self.ticks, seconds * 1000, self.elapsed, self.sampling_time
+            ),
+            "thread-seconds by subcommand and category:",
+            "{0:<24}{1:>9}".format("subcommand", "total")
+            + "".join("{0:>9}".format(category) for category in CATEGORIES),
+        ]
+        for label, counts in sorted(
+            by_label.items(), key=lambda item: -sum(item[1].values())
+        ):
+            lines.append(
+                "{0:<24}{1:>9.2f}".format(label, sum(counts.values()) * seconds)
+                + "".join(
+                    "{0:>9.2f}".format(counts[category] * seconds)
+                    for category in CATEGORIES
+                )
+            )
+        lines.append("top {0} functions:".format(top))
+        lines.append("{0:>9}{1:>9}  {2}".format("self", "total", "function"))
+        for code, count in own.most_common(top):
+            lines.append(
+                "{0:>9.2f}{1:>9.2f}  {2}".format(
+                    count * seconds, under[code] * seconds, frame_name(code)
+                )
+            )
+        return lines
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""Report writers that turn cli_driver results into CI artifacts.
+
+Both writers take an iterable of the result records cli_driver streams to its
+results file (see ResultStore) and read it once, so they work the same on a
+short suite run and on a soak run with hundreds of thousands of results.
+"""
+
+import collections
+from html import escape
+import heapq
+import json
+import time
+
+
+def quoteattr(value):
+    return '"{0}"'.format(escape(value))
+
+
+def testcase_name(result):
+    """A name that stays the same across builds (messages carry random account
+    names), so CI can track a check's duration trend."""
+    if result.get("image"):
+        return "{0} ({1})".format(result["name"], result["image"])
+    return result["name"]
+
+
+def write_junit(results, path, tests, failures, errors, elapsed, suite="cli_driver"):
+    """Write results as a JUnit XML testsuite.
+
+    tests, failures and errors (timeouts) are the totals for the testsuite
+    element, which comes before the testcases; every testcase gets its measured
+    duration as time and its step as classname, and a failed one carries the
+    message and error (a timed out one as an error element).
+    """
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write("<testsuites>\n")
+        f.write(
+            '  <testsuite name={0} tests="{1}" failures="{2}" errors="{3}" '
+            'time="{4:.3f}" timestamp={5}>\n'.format(
+                quoteattr(suite),
+                tests,
+                failures,
+                errors,
+                elapsed,
+                quoteattr(time.strftime("%Y-%m-%dT%H:%M:%S")),
+            )
+        )
+        for result in results:
+            f.write(
+                '    <testcase classname={0} name={1} time="{2:.3f}"'.format(
+                    quoteattr("{0}.{1}".format(suite, result["step"] or "driver")),
+                    quoteattr(
+                        "{0} [{1}]".format(testcase_name(result), result["polarity"])
+                    ),
+                    result["duration"],
+                )
+            )
+            if result["outcome"] == "pass":
+                f.write(" />\n")
+                continue
+            element = "error" if result["outcome"] == "timeout" else "failure"
+            f.write(">\n")
+            f.write(
+                "      <{0} message={1}>{2}</{0}>\n".format(
+                    element,
+                    quoteattr(result["message"]),
+                    escape(result["error"] or result["message"], quote=False),
+                )
+            )
+            f.write("    </testcase>\n")
+        f.write("  </testsuite>\n")
+        f.write("</testsuites>\n")
+
+
+def summarize(results, slowest=10):
+    """Totals, per-check durations, the slowest results and every failure
+    (timeouts included)."""
+    totals = collections.Counter()
+    checks = {}
+    slow = []
+    failed = []
+    for result in results:
+        totals["{0}_{1}".format(result["polarity"], result["outcome"])] += 1
+        name = testcase_name(result)
+        entry = checks.setdefault(
+            name,
+            {"count": 0, "failures": 0, "timeouts": 0, "total_s": 0.0, "max_s": 0.0},
+        )
+        entry["count"] += 1
+        entry["failures"] += result["outcome"] == "fail"
+        entry["timeouts"] += result["outcome"] == "timeout"
+        entry["total_s"] += result["duration"]
+        entry["max_s"] = max(entry["max_s"], result["duration"])
+        if len(slow) < slowest:
+            heapq.heappush(slow, (result["duration"], name, result["step"] or ""))
+        else:
+            heapq.heappushpop(slow, (result["duration"], name, result["step"] or ""))
+        if result["outcome"] != "pass":
+            failed.append(result)
+    for entry in checks.values():
+        entry["total_s"] = round(entry["total_s"], 3)
+        entry["avg_s"] = round(entry["total_s"] / entry["count"], 3)
+    return {
+        "totals": dict(totals),
+        "checks": checks,
+        "slowest": [
+            {"name": name, "step": step, "duration_s": duration}
+            for duration, name, step in sorted(slow, reverse=True)
+        ],
+        "failures": failed,
+    }
+
+
+def write_summary(results, path, elapsed, steps=None, slowest=10):
+    """Write the JSON summary of a run; steps maps step names to seconds."""
+    summary = summarize(results, slowest)
+    summary["elapsed_s"] = round(elapsed, 3)
+    summary["steps"] = dict(
+        (name, round(seconds, 3)) for name, seconds in (steps or {}).items()
+    )
+    summary["passed"] = not summary["failures"]
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
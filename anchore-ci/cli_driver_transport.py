@@ -0,0 +1,1007 @@
+#!/usr/bin/env python
+
+"""Transports used by cli_driver to execute anchore-cli commands.
+
+Every transport takes the argv built from assemble_command() and returns a
+subprocess.CompletedProcess, raising subprocess.CalledProcessError on a non-zero
+exit, so the checks can keep reading stdout (and CalledProcessError.stdout) the
+way they always have. Transports that start a process per command set
+spawn_time on the result (or error) for the driver's timing report.
+
+run() also takes a timeout in seconds: a command still running at its deadline
+is stopped (its process tree killed, or its connection given up on) and
+CommandTimeout raised instead.
+"""
+
+import base64
+import contextlib
+import gzip
+import heapq
+import http.client
+import io
+import itertools
+import json
+import os
+import queue
+import shlex
+import signal
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from urllib.parse import quote, urlencode, urlsplit
+
+
+class UnsupportedCommand(ValueError):
+    """Raised when a transport has no mapping for an anchore-cli command."""
+
+
+class ApiError(Exception):
+    """An error response from the engine API (or a client-side failure that
+    anchore-cli would report in the same shape)."""
+
+    def __init__(self, payload, httpcode=None):
+        super().__init__(payload)
+        self.payload = payload
+        self.httpcode = httpcode
+
+    @property
+    def returncode(self):
+        # mirror anchorecli.cli.utils.get_ecode()
+        if self.httpcode is None or self.httpcode in [401, 500]:
+            return 2
+        return 1
+
+
+class CommandTimeout(subprocess.TimeoutExpired):
+    """Raised when a command runs past its deadline; whatever it started has
+    been killed by then."""
+
+    def __str__(self):
+        return "Command '{0}' timed out after {1} seconds".format(
+            " ".join(self.cmd), self.timeout
+        )
+
+
+class Watchdog:
+    """Call a function for every deadline that expires before it is cancelled.
+
+    One background thread serves every deadline, so a command costs a heap push
+    and pop rather than a timer thread of its own.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._deadlines = []
+        self._order = itertools.count()
+        self._thread = None
+
+    def watch(self, timeout, on_expiry):
+        """Start a deadline timeout seconds from now; returns its handle, whose
+        expired attribute tells whether on_expiry was called."""
+        deadline = _Deadline(time.time() + timeout, on_expiry)
+        with self._condition:
+            heapq.heappush(self._deadlines, (deadline.at, next(self._order), deadline))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="command-watchdog", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+        return deadline
+
+    def cancel(self, deadline):
+        with self._condition:
+            deadline.cancelled = True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._deadlines:
+                    self._condition.wait()
+                at, _, deadline = self._deadlines[0]
+                if deadline.cancelled:
+                    heapq.heappop(self._deadlines)
+                    continue
+                if at > time.time():
+                    self._condition.wait(at - time.time())
+                    continue
+                heapq.heappop(self._deadlines)
+                deadline.expired = True
+            try:
+                deadline.on_expiry()
+            except Exception:
+                pass
+
+
+class _Deadline:
+    def __init__(self, at, on_expiry):
+        self.at = at
+        self.on_expiry = on_expiry
+        self.cancelled = False
+        self.expired = False
+
+
+watchdog = Watchdog()
+
+
+def kill_process_tree(proc):
+    """Kill a process started in a session of its own, and everything it started."""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def split_command(argv):
+    """Split an assembled command into (user, password, url, cli args).
+
+    Anything before --u (the anchore-cli or kubectl prefix) is dropped.
+    """
+    user = password = url = None
+    index = 0
+    while index < len(argv):
+        token = argv[index]
+        if token == "--u":
+            user = argv[index + 1]
+        elif token == "--p":
+            password = argv[index + 1]
+        elif token == "--url":
+            url = argv[index + 1]
+            return user, password, url, argv[index + 2 :]
+        else:
+            index += 1
+            continue
+        index += 2
+    raise ValueError("no --url found in command: {0}".format(" ".join(argv)))
+
+
+def format_payload(payload):
+    """Render a payload the way `anchore-cli --json` prints it."""
+    try:
+        output = json.dumps(payload, indent=4, sort_keys=True)
+    except Exception:
+        output = json.dumps({"payload": str(payload)}, indent=4, sort_keys=True)
+    return (output + "\n").encode("utf-8")
+
+
+class SubprocessTransport:
+    """Fork a fresh anchore-cli (or kubectl exec) process per command."""
+
+    name = "subprocess"
+
+    @classmethod
+    def from_config(cls, settings):
+        return cls()
+
+    def run(self, argv, timeout=None):
+        started = time.time()
+        # a session of its own, so the whole tree (kubectl and all) can be killed
+        proc = subprocess.Popen(argv, stdout=subprocess.PIPE, start_new_session=True)
+        spawn_time = time.time() - started
+        deadline = None
+        if timeout:
+            deadline = watchdog.watch(timeout, lambda: kill_process_tree(proc))
+        try:
+            stdout, _ = proc.communicate()
+        finally:
+            if deadline:
+                watchdog.cancel(deadline)
+        if deadline and deadline.expired:
+            error = CommandTimeout(argv, timeout, output=stdout)
+            error.spawn_time = spawn_time
+            raise error
+        if proc.returncode:
+            error = subprocess.CalledProcessError(proc.returncode, argv, output=stdout)
+            error.spawn_time = spawn_time
+            raise error
+        result = subprocess.CompletedProcess(argv, 0, stdout=stdout)
+        result.spawn_time = spawn_time
+        return result
+
+    def close(self):
+        pass
+
+
+class InProcessTransport:
+    """Invoke the anchorecli click application inside this interpreter.
+
+    anchorecli is imported once, so each command pays for the CLI code path but
+    not for interpreter startup. stdout is captured and the exit code taken from
+    the SystemExit anchore-cli raises, giving the same CompletedProcess and
+    CalledProcessError shapes as the subprocess transport. Capturing stdout is
+    process wide, so commands are serialised.
+
+    A command running in this thread can't be killed, so timeouts are not
+    enforced; use the subprocess or http transport when they matter.
+    """
+
+    name = "inprocess"
+
+    def __init__(self):
+        from anchorecli.cli import main_entry
+
+        # anchore-cli closes stdout and stderr before exiting unless told not to,
+        # which would close the capture buffer and the driver's own stderr
+        os.environ["ANCHORE_CLI_NO_FDS_CLEANUP"] = "y"
+        self.main_entry = main_entry
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, settings):
+        return cls()
+
+    def run(self, argv, timeout=None):
+        if argv[0] != "anchore-cli":
+            raise UnsupportedCommand(
+                "inprocess transport can only run a local anchore-cli, not: {0}".format(
+                    argv[0]
+                )
+            )
+        with self._lock:
+            buffer = io.StringIO()
+            with contextlib.redirect_stdout(buffer):
+                returncode = self._invoke(argv[1:])
+            stdout = buffer.getvalue().encode("utf-8")
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, argv, output=stdout)
+        return subprocess.CompletedProcess(argv, 0, stdout=stdout)
+
+    def _invoke(self, args):
+        import click
+
+        try:
+            self.main_entry.main(
+                args=args, prog_name="anchore-cli", standalone_mode=False
+            )
+        except SystemExit as e:
+            if e.code is None:
+                return 0
+            return e.code if isinstance(e.code, int) else 1
+        except click.ClickException as e:
+            e.show()
+            return e.exit_code
+        except click.exceptions.Exit as e:
+            return e.exit_code
+        except click.exceptions.Abort:
+            return 1
+        return 0
+
+    def close(self):
+        pass
+
+
+class ShellSession:
+    """One long-lived shell (e.g. a `kubectl exec -i` into the anchore-cli pod).
+
+    Commands are written to the shell's stdin followed by a marker line carrying
+    the exit code, so each command costs a round trip instead of a new exec.
+    """
+
+    def __init__(self, shell_argv):
+        self.shell_argv = shell_argv
+        self.marker = "__cli_driver_{0}__".format(uuid.uuid4().hex).encode("ascii")
+        self.proc = None
+
+    def _start(self):
+        self.proc = subprocess.Popen(
+            self.shell_argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            start_new_session=True,
+        )
+
+    def run(self, argv, command, timeout=None):
+        if self.proc is None or self.proc.poll() is not None:
+            self._start()
+        deadline = None
+        if timeout:
+            # killing the shell ends the readline() below; the session is then
+            # closed and a new one started by the next command
+            proc = self.proc
+            deadline = watchdog.watch(timeout, lambda: kill_process_tree(proc))
+        try:
+            return self._run(argv, command, deadline, timeout)
+        finally:
+            if deadline:
+                watchdog.cancel(deadline)
+
+    def _run(self, argv, command, deadline, timeout):
+        line = "{0} </dev/null; printf '\\n%s %d\\n' {1} $?\n".format(
+            " ".join(shlex.quote(arg) for arg in command), self.marker.decode("ascii")
+        )
+        try:
+            self.proc.stdin.write(line.encode("utf-8"))
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.close()
+            raise RuntimeError("shell session {0} exited".format(self.shell_argv))
+
+        chunks = []
+        while True:
+            output = self.proc.stdout.readline()
+            if not output:
+                self.close()
+                if deadline and deadline.expired:
+                    raise CommandTimeout(argv, timeout, output=b"".join(chunks))
+                raise RuntimeError(
+                    "shell session {0} exited mid-command".format(self.shell_argv)
+                )
+            if output.startswith(self.marker):
+                returncode = int(output[len(self.marker) :].strip())
+                break
+            chunks.append(output)
+        # drop the newline printf put in front of the marker
+        stdout = b"".join(chunks)[:-1]
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, argv, output=stdout)
+        return subprocess.CompletedProcess(argv, 0, stdout=stdout)
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.proc = None
+
+
+class SessionTransport:
+    """Run commands through a small pool of persistent shell sessions.
+
+    Intended for the CLI-in-cluster mode: instead of a `kubectl exec` per
+    command, the part of the assembled command after `--` is sent to a shell
+    already running inside the anchore-cli pod.
+    """
+
+    name = "session"
+
+    def __init__(self, shell_command, pool_size=1):
+        self.shell_argv = shell_command.split()
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, settings):
+        return cls(settings.cli_session_command, settings.cli_session_pool_size)
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle.empty() and len(self._sessions) < self.pool_size:
+                session = ShellSession(self.shell_argv)
+                self._sessions.append(session)
+                return session
+        return self._idle.get()
+
+    def run(self, argv, timeout=None):
+        # `kubectl exec anchore-cli -- anchore-cli --json ...`: keep what runs in the pod
+        command = argv[argv.index("--") + 1 :] if "--" in argv else argv
+        session = self._acquire()
+        try:
+            return session.run(argv, command, timeout)
+        finally:
+            self._idle.put(session)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+
+
+class HttpTransport:
+    """Talk to the engine API directly, skipping the anchore-cli process.
+
+    Connections are kept alive and pooled per thread and per host, and the
+    anchore-cli commands the driver issues are translated into the same API calls
+    anchore-cli would make, so the output matches `anchore-cli --json`.
+    """
+
+    name = "http"
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls, settings):
+        return cls(timeout=settings.http_timeout)
+
+    def _connection(self, scheme, netloc, fresh=False):
+        pool = getattr(self._local, "pool", None)
+        if pool is None:
+            pool = self._local.pool = {}
+        key = (scheme, netloc)
+        conn = pool.get(key)
+        if conn is not None and fresh:
+            conn.close()
+            conn = None
+        if conn is None:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            pool[key] = conn
+        return conn
+
+    def request(self, call, method, path, params=None, body=None):
+        """Issue one API request and return the decoded payload.
+
+        Raises ApiError on any non-2xx response.
+        """
+        parts = urlsplit(call.url.rstrip("/"))
+        target = parts.path + path
+        if params:
+            target = target + "?" + urlencode(params)
+        headers = {
+            "Authorization": call.auth,
+            "Connection": "keep-alive",
+            "Accept": "application/json",
+        }
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+
+        # a pooled connection may have been closed by the server since it was
+        # last used; retry exactly once on a fresh one
+        for attempt in range(2):
+            conn = self._connection(parts.scheme, parts.netloc, fresh=attempt > 0)
+            # every socket operation gets what is left of the command's deadline
+            timeout = self.timeout
+            if call.deadline is not None:
+                timeout = min(timeout, call.deadline - time.time())
+                if timeout <= 0:
+                    raise socket.timeout("command deadline passed")
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(method, target, body=data, headers=headers)
+                response = conn.getresponse()
+                status = response.status
+                text = response.read().decode("utf-8")
+                break
+            except socket.timeout:
+                # the response may still arrive; don't reuse this connection
+                conn.close()
+                raise
+            except (
+                http.client.RemoteDisconnected,
+                http.client.CannotSendRequest,
+                ConnectionResetError,
+                BrokenPipeError,
+            ):
+                conn.close()
+                if attempt:
+                    raise
+
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            payload = text
+
+        # mirror anchorecli.clients.common.make_client_result()
+        if 200 <= status < 299:
+            return payload
+        if not payload and status == 401:
+            payload = "Unauthorized - please check your username/password"
+        raise ApiError(payload, status)
+
+    def run(self, argv, timeout=None):
+        user, password, url, args = split_command(argv)
+        call = _HttpCall(self, user, password, url)
+        if timeout:
+            call.deadline = time.time() + timeout
+        try:
+            payload = _dispatch(call, args)
+        except socket.timeout:
+            raise CommandTimeout(argv, timeout or self.timeout)
+        except ApiError as e:
+            raise subprocess.CalledProcessError(
+                e.returncode, argv, output=format_payload(e.payload)
+            )
+        if isinstance(payload, bytes):
+            return subprocess.CompletedProcess(argv, 0, stdout=payload)
+        return subprocess.CompletedProcess(argv, 0, stdout=format_payload(payload))
+
+    def close(self):
+        pool = getattr(self._local, "pool", None) or {}
+        for conn in pool.values():
+            conn.close()
+        pool.clear()
+
+
+class _HttpCall:
+    """Credentials and helpers for the API calls behind one command."""
+
+    def __init__(self, transport, user, password, url):
+        self.transport = transport
+        self.url = url
+        self.deadline = None
+        token = "{0}:{1}".format(user, password).encode("utf-8")
+        self.auth = "Basic " + base64.b64encode(token).decode("ascii")
+
+    def get(self, path, params=None):
+        return self.transport.request(self, "GET", path, params=params)
+
+    def post(self, path, params=None, body=None):
+        return self.transport.request(self, "POST", path, params=params, body=body)
+
+    def put(self, path, params=None, body=None):
+        return self.transport.request(self, "PUT", path, params=params, body=body)
+
+    def delete(self, path, params=None):
+        return self.transport.request(self, "DELETE", path, params=params)
+
+    def image_digest(self, image):
+        if image.startswith("sha256:"):
+            return image
+        images = self.get("/images", {"fulltag": image, "history": "false"})
+        if not images:
+            raise ApiError({"message": "cannot use input image string"}, None)
+        return images[0]["imageDigest"]
+
+    def subscription_id(self, sub_type, sub_key):
+        records = self.get(
+            "/subscriptions",
+            {"subscription_key": sub_key, "subscription_type": sub_type},
+        )
+        if not records:
+            raise ApiError(
+                {
+                    "message": "cannot locate subscription record using specified "
+                    "input (subscription_type={0}, subscription_key={1})".format(
+                        sub_type, sub_key
+                    )
+                },
+                None,
+            )
+        return records[0]["subscription_id"]
+
+
+# anchore-cli options that take no value; every other option takes one
+FLAG_OPTIONS = ["--force", "--dontask", "--enable", "--disable", "--all"]
+
+
+def _parse_args(args):
+    """Split cli args into positional words and an options dict."""
+    words = []
+    options = {}
+    index = 0
+    while index < len(args):
+        token = args[index]
+        if token.startswith("--"):
+            name = token[2:]
+            if token in FLAG_OPTIONS:
+                options[name] = True
+                index += 1
+            else:
+                options[name] = args[index + 1]
+                index += 2
+        else:
+            words.append(token)
+            index += 1
+    return words, options
+
+
+def _q(value):
+    return quote(value, "")
+
+
+def _account_name(call, options):
+    if options.get("account"):
+        return options["account"]
+    return call.get("/account")["name"]
+
+
+def _account_add(call, words, options):
+    body = {"name": words[0]}
+    if options.get("email"):
+        body["email"] = options["email"]
+    return call.post("/accounts", body=body)
+
+
+def _account_state(call, name, state):
+    return call.put("/accounts/{0}/state".format(_q(name)), body={"state": state})
+
+
+def _image_wait(call, image, options):
+    timeout = float(options.get("timeout", -1))
+    interval = float(options.get("interval", 5))
+    started = time.time()
+    while timeout < 0 or time.time() - started < timeout:
+        images = call.get("/images", {"fulltag": image, "history": "false"})
+        if not images:
+            raise ApiError({"message": "Requested image not found in system"}, None)
+        if images[0]["analysis_status"] in ["analyzed", "analysis_failed"]:
+            return images
+        time.sleep(interval)
+    raise ApiError(
+        {
+            "message": "Timed-out waiting for analyis status to reach terminal "
+            "state (analyzed or analysis_failed)"
+        },
+        None,
+    )
+
+
+def _image_query(call, group, words):
+    digest = call.image_digest(words[0])
+    path = "/images/{0}/{1}".format(digest, group)
+    if len(words) > 1:
+        path = "{0}/{1}".format(path, words[1])
+    if group == "vuln":
+        return call.get(path, {"vendor_only": "True"})
+    return call.get(path)
+
+
+def _image_del(call, words, options):
+    digest = call.image_digest(words[0])
+    params = {"force": "True"} if options.get("force") else None
+    payload = call.delete("/images/{0}".format(digest), params)
+    if isinstance(payload, dict) and payload.get("status") != "deleting":
+        raise ApiError({"message": payload.get("detail", "cannot delete image")}, 400)
+    return payload
+
+
+def _subscription_toggle(call, sub_type, sub_key, active):
+    sub_id = call.subscription_id(sub_type, sub_key)
+    return call.put(
+        "/subscriptions/{0}".format(sub_id),
+        body={
+            "active": active,
+            "subscription_key": sub_key,
+            "subscription_type": sub_type,
+        },
+    )
+
+
+def _repos(call, repo=None):
+    records = call.get("/subscriptions", {"subscription_type": "repo_update"})
+    return [
+        record
+        for record in records
+        if record["subscription_type"] == "repo_update"
+        and (not repo or record["subscription_key"] == repo)
+    ]
+
+
+def _system_wait(call, options):
+    timeout = float(options.get("timeout", -1))
+    interval = float(options.get("interval", 5))
+    services = options.get(
+        "servicesready", "catalog,apiext,policy_engine,simplequeue,analyzer"
+    )
+    feeds = options.get("feedsready", "vulnerabilities")
+    started = time.time()
+    while timeout < 0 or time.time() - started < timeout:
+        try:
+            up = dict((name, False) for name in services.split(",") if name)
+            for service in call.get("/system").get("service_states", []):
+                detail = service.get("service_detail", {})
+                if isinstance(detail, dict) and detail.get("up"):
+                    up[service["servicename"]] = True
+            synced = dict((name, False) for name in feeds.split(",") if name)
+            if synced:
+                for feed in call.get("/system/feeds"):
+                    if feed.get("name") in synced and feed.get("last_full_sync"):
+                        synced[feed["name"]] = True
+            if all(up.values()) and all(synced.values()):
+                return b""
+        except (ApiError, OSError, http.client.HTTPException):
+            pass
+        time.sleep(interval)
+    raise ApiError(
+        {"message": "timed out after {0} seconds.".format(options.get("timeout"))},
+        None,
+    )
+
+
+# anchore-cli command words -> handler(call, positional words, options)
+COMMANDS = {
+    ("account", "add"): _account_add,
+    ("account", "get"): lambda c, w, o: c.get("/accounts/{0}".format(_q(w[0]))),
+    ("account", "enable"): lambda c, w, o: _account_state(c, w[0], "enabled"),
+    ("account", "disable"): lambda c, w, o: _account_state(c, w[0], "disabled"),
+    ("account", "del"): lambda c, w, o: c.delete("/accounts/{0}".format(_q(w[0]))),
+    ("account", "list"): lambda c, w, o: c.get("/accounts"),
+    ("account", "whoami"): lambda c, w, o: {
+        "account": c.get("/account"),
+        "user": c.get("/user"),
+    },
+    ("account", "user", "list"): lambda c, w, o: c.get(
+        "/accounts/{0}/users".format(_q(_account_name(c, o)))
+    ),
+    ("account", "user", "add"): lambda c, w, o: c.post(
+        "/accounts/{0}/users".format(_q(_account_name(c, o))),
+        body={"username": w[0], "password": w[1]},
+    ),
+    ("account", "user", "get"): lambda c, w, o: c.get(
+        "/accounts/{0}/users/{1}".format(_q(_account_name(c, o)), _q(w[0]))
+    ),
+    ("account", "user", "del"): lambda c, w, o: c.delete(
+        "/accounts/{0}/users/{1}".format(_q(_account_name(c, o)), _q(w[0]))
+    ),
+    ("account", "user", "setpassword"): lambda c, w, o: c.post(
+        "/accounts/{0}/users/{1}/credentials".format(
+            _q(_account_name(c, o)), _q(o["username"])
+        ),
+        body={"type": "password", "value": w[0]},
+    ),
+    ("analysis-archive", "images", "add"): lambda c, w, o: c.post(
+        "/archives/images", body=list(w)
+    ),
+    ("analysis-archive", "images", "del"): lambda c, w, o: c.delete(
+        "/archives/images/{0}".format(w[0])
+    ),
+    ("evaluate", "check"): lambda c, w, o: c.get(
+        "/images/{0}/check".format(c.image_digest(w[0])),
+        {"history": "false", "detail": "false", "tag": w[0]},
+    ),
+    ("image", "add"): lambda c, w, o: c.post(
+        "/images", {"autosubscribe": "True"}, body={"tag": w[0]}
+    ),
+    ("image", "get"): lambda c, w, o: c.get(
+        "/images", {"fulltag": w[0], "history": "false"}
+    ),
+    ("image", "list"): lambda c, w, o: c.get("/images"),
+    ("image", "wait"): lambda c, w, o: _image_wait(c, w[0], o),
+    ("image", "content"): lambda c, w, o: _image_query(c, "content", w),
+    ("image", "metadata"): lambda c, w, o: _image_query(c, "metadata", w),
+    ("image", "vuln"): lambda c, w, o: _image_query(c, "vuln", w),
+    ("image", "del"): _image_del,
+    ("registry", "add"): lambda c, w, o: c.post(
+        "/registries",
+        {"validate": "True"},
+        body={
+            "registry": w[0],
+            "registry_user": w[1],
+            "registry_pass": w[2],
+            "registry_type": o.get("registry-type", "docker_v2"),
+            "registry_verify": True,
+            "registry_name": None,
+        },
+    ),
+    ("registry", "get"): lambda c, w, o: c.get("/registries/{0}".format(_q(w[0]))),
+    ("registry", "list"): lambda c, w, o: c.get("/registries"),
+    ("registry", "del"): lambda c, w, o: c.delete("/registries/{0}".format(_q(w[0]))),
+    ("repo", "add"): lambda c, w, o: c.post(
+        "/repositories",
+        {"repository": w[0], "autosubscribe": "False", "dryrun": "False"},
+    ),
+    ("repo", "list"): lambda c, w, o: _repos(c),
+    ("repo", "get"): lambda c, w, o: _repos(c, w[0]),
+    ("repo", "watch"): lambda c, w, o: _subscription_toggle(
+        c, "repo_update", w[0], True
+    ),
+    ("repo", "unwatch"): lambda c, w, o: _subscription_toggle(
+        c, "repo_update", w[0], False
+    ),
+    ("repo", "del"): lambda c, w, o: c.delete(
+        "/subscriptions/{0}".format(c.subscription_id("repo_update", w[0]))
+    ),
+    ("subscription", "list"): lambda c, w, o: c.get("/subscriptions"),
+    ("subscription", "activate"): lambda c, w, o: _subscription_toggle(
+        c, w[0], w[1], True
+    ),
+    ("subscription", "deactivate"): lambda c, w, o: _subscription_toggle(
+        c, w[0], w[1], False
+    ),
+    ("system", "status"): lambda c, w, o: c.get("/system"),
+    ("system", "errorcodes"): lambda c, w, o: c.get("/system/error_codes"),
+    ("system", "wait"): lambda c, w, o: _system_wait(c, o),
+    ("system", "feeds", "list"): lambda c, w, o: c.get("/system/feeds"),
+    ("system", "feeds", "config"): lambda c, w, o: c.put(
+        "/system/feeds/{0}/{1}".format(w[0], o["group"])
+        if o.get("group")
+        else "/system/feeds/{0}".format(w[0]),
+        {"enabled": "true" if o.get("enable") else "false"},
+    ),
+    ("system", "feeds", "delete"): lambda c, w, o: c.delete(
+        "/system/feeds/{0}/{1}".format(w[0], o["group"])
+        if o.get("group")
+        else "/system/feeds/{0}".format(w[0])
+    ),
+}
+
+
+def _dispatch(call, args):
+    words, options = _parse_args(args)
+    for depth in (3, 2):
+        handler = COMMANDS.get(tuple(words[:depth]))
+        if handler:
+            return handler(call, words[depth:], options)
+    raise UnsupportedCommand(
+        "no http mapping for anchore-cli command: {0}".format(" ".join(args))
+    )
+
+
+class IdentityMap:
+    """Values the driver generated at random (account names, users, emails,
+    passwords), by kind, so cassettes can refer to them by placeholder."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds = {}
+
+    def add(self, kind, value):
+        with self._lock:
+            self._kinds[str(value)] = kind
+
+    def placeholders(self, tokens):
+        """Map every identity among tokens to a placeholder like <user:0>,
+        numbered per kind in order of appearance in this command."""
+        mapping = {}
+        counts = {}
+        with self._lock:
+            for token in tokens:
+                kind = self._kinds.get(token)
+                if kind and token not in mapping:
+                    mapping[token] = "<{0}:{1}>".format(kind, counts.get(kind, 0))
+                    counts[kind] = counts.get(kind, 0) + 1
+        return mapping
+
+
+def _substitute(text, mapping):
+    for value in sorted(mapping, key=len, reverse=True):
+        text = text.replace(value, mapping[value])
+    return text
+
+
+def _cassette_key(argv, mapping):
+    """The normalised command: user plus anchore-cli args, identities replaced;
+    the password and url are left out so runs against other engines match."""
+    user, _, _, args = split_command(argv)
+    return " ".join([mapping.get(user, user)] + [mapping.get(arg, arg) for arg in args])
+
+
+def _cassette_signature(key):
+    """Fallback index: the first two command words, e.g. "image vuln"."""
+    words, _ = _parse_args(key.split()[1:])
+    return " ".join(words[:2])
+
+
+class RecordingTransport:
+    """Wrap another transport and write every command and its response to a
+    cassette (gzipped JSON lines) that ReplayTransport can serve later.
+
+    The first line holds the random seed of the run; every other line a
+    normalised command, its exit code, stdout and the time it took.
+    """
+
+    name = "record"
+
+    def __init__(self, inner, path, seed):
+        self.inner = inner
+        self.identities = IdentityMap()
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._write({"version": 1, "seed": seed, "transport": inner.name})
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def run(self, argv, timeout=None):
+        started = time.time()
+        error = None
+        entry = {}
+        try:
+            result = self.inner.run(argv, timeout)
+            returncode, stdout = 0, result.stdout
+        except CommandTimeout as e:
+            error = e
+            returncode, stdout = -signal.SIGKILL, e.stdout
+            entry["timeout"] = e.timeout
+        except subprocess.CalledProcessError as e:
+            error = e
+            returncode, stdout = e.returncode, e.stdout
+        mapping = self.identities.placeholders(argv)
+        entry.update(
+            {
+                "key": _cassette_key(argv, mapping),
+                "rc": returncode,
+                "out": _substitute((stdout or b"").decode("utf-8"), mapping),
+                "time": round(time.time() - started, 4),
+            }
+        )
+        self._write(entry)
+        if error is not None:
+            raise error
+        return result
+
+    def close(self):
+        self.inner.close()
+        with self._lock:
+            self._file.close()
+
+
+class ReplayTransport:
+    """Serve commands from a cassette written by RecordingTransport.
+
+    Responses are indexed by normalised command; repeated commands get the
+    recorded responses in order, the last one repeating once they run out.
+    A command that was never recorded falls back to a response recorded for
+    the same subcommand (counted in misses), and failing that to an error.
+    Commands that timed out while recording time out again, immediately.
+    """
+
+    name = "replay"
+
+    def __init__(self, path):
+        self.identities = IdentityMap()
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._fallback = {}
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            for line in f:
+                entry = json.loads(line)
+                self._index.setdefault(entry["key"], []).append(entry)
+                self._fallback.setdefault(_cassette_signature(entry["key"]), []).append(
+                    entry
+                )
+        self.seed = header["seed"]
+
+    def _next(self, key):
+        with self._lock:
+            entries = self._index.get(key)
+            if entries is None:
+                self.misses += 1
+                entries = self._fallback.get(_cassette_signature(key))
+                if not entries:
+                    return None
+            return entries.pop(0) if len(entries) > 1 else entries[0]
+
+    def run(self, argv, timeout=None):
+        mapping = self.identities.placeholders(argv)
+        key = _cassette_key(argv, mapping)
+        entry = self._next(key)
+        if entry is None:
+            raise subprocess.CalledProcessError(
+                1,
+                argv,
+                output=format_payload(
+                    {"message": "no recorded response for command: {0}".format(key)}
+                ),
+            )
+        values = dict((placeholder, value) for value, placeholder in mapping.items())
+        stdout = _substitute(entry["out"], values).encode("utf-8")
+        if "timeout" in entry:
+            raise CommandTimeout(argv, entry["timeout"], output=stdout)
+        if entry["rc"]:
+            raise subprocess.CalledProcessError(entry["rc"], argv, output=stdout)
+        return subprocess.CompletedProcess(argv, 0, stdout=stdout)
+
+    def close(self):
+        pass
+
+
+TRANSPORTS = {
+    SubprocessTransport.name: SubprocessTransport,
+    InProcessTransport.name: InProcessTransport,
+    SessionTransport.name: SessionTransport,
+    HttpTransport.name: HttpTransport,
+}
+
+
+def make_transport(name, settings):
+    """Build the transport registered under name from the settings module."""
+    try:
+        transport_class = TRANSPORTS[name]
+    except KeyError:
+        raise ValueError(
+            "unknown transport {0}; choose one of {1}".format(
+                name, ", ".join(sorted(TRANSPORTS))
+            )
+        )
+    return transport_class.from_config(settings)
@@ -0,0 +1,1073 @@
+#!/usr/bin/env python
+"""A local stand-in for the Anchore Engine external API.
+
+Implements the endpoints cli_driver.py (through anchore-cli or its http
+transport) touches: accounts and users, images and their content, metadata,
+vulnerabilities and policy evaluation, repositories, subscriptions, registries,
+the analysis archive, system status and feeds. Responses have the shapes the
+engine returns; state is kept in memory per account. Images "analyze" for a
+configurable number of seconds after they are added, every request can be
+delayed by a configurable latency, and the number of packages and
+vulnerabilities generated per image is configurable too. Generated data is
+deterministic for a given seed.
+
+Run standalone with `python mock_engine.py --port 8228`, or let the driver
+start one in-process with `cli_driver.py --mock`.
+"""
+
+import argparse
+import base64
+import datetime
+import hashlib
+import heapq
+import http.server
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, unquote, urlsplit
+
+SERVICES = ["catalog", "apiext", "policy_engine", "simplequeue", "analyzer"]
+
+FEEDS = {
+    "vulnerabilities": [
+        "alpine:3.12",
+        "amzn:2",
+        "debian:10",
+        "rhel:8",
+        "ubuntu:20.04",
+    ],
+    "nvdv2": ["nvdv2:cves"],
+    "github": ["github:gem", "github:npm", "github:python"],
+}
+
+CONTENT_TYPES = [
+    "os",
+    "files",
+    "npm",
+    "gem",
+    "python",
+    "java",
+    "binary",
+    "go",
+    "malware",
+    "nuget",
+]
+
+METADATA_TYPES = ["manifest", "docker_history", "dockerfile"]
+
+VULNERABILITY_TYPES = ["os", "non-os", "all"]
+
+SEVERITIES = ["Unknown", "Negligible", "Low", "Medium", "High", "Critical"]
+
+ERROR_CODES = [
+    "ANCHORE_SECRETS_UNAVAILABLE",
+    "DB_NOT_INITIALIZED",
+    "INVALID_ACCOUNT_STATE",
+    "REGISTRY_ACCESS_ERROR",
+    "REGISTRY_IMAGE_NOT_FOUND",
+    "SERVICE_UNAVAILABLE",
+    "UNKNOWN",
+]
+
+DEFAULT_POLICY_ID = "2c53a13c-1765-11e8-82ef-23527761d060"
+
+
+class MockApiError(Exception):
+    """An error response, with the engine's error body."""
+
+    def __init__(self, httpcode, message, detail=None):
+        super().__init__(message)
+        self.httpcode = httpcode
+        self.message = message
+        self.detail = detail or {}
+
+    def payload(self):
+        return {
+            "httpcode": self.httpcode,
+            "message": self.message,
+            "detail": self.detail,
+        }
+
+
+def now():
+    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_image_ref(image):
+    """Split an image reference into (registry, repo, tag) the way the engine
+    normalizes it: docker.io when no registry is given, latest when no tag is."""
+    registry = "docker.io"
+    name = image
+    first = image.split("/")[0]
+    if "/" in image and ("." in first or ":" in first or first == "localhost"):
+        registry, name = image.split("/", 1)
+    tag = "latest"
+    if ":" in name:
+        name, tag = name.rsplit(":", 1)
+    return registry, name, tag
+
+
+def fulltag(image):
+    return "{0}/{1}:{2}".format(*parse_image_ref(image))
+
+
+class MockEngine:
+    """In-memory engine state and the API routes that act on it."""
+
+    def __init__(
+        self,
+        admin_user="admin",
+        admin_password="foobar",
+        latency=0.0,
+        jitter=0.0,
+        analysis_time=1.0,
+        analyzers=0,
+        packages=100,
+        vulnerabilities=50,
+        seed=0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.analysis_time = analysis_time
+        # with a fixed number of analyzers, added images queue for the next
+        # free one (the times they free up, as a heap); 0 means no queueing
+        self.analyzers = analyzers
+        self.analyzers_free = [0.0] * analyzers
+        self.packages = packages
+        self.vulnerabilities = vulnerabilities
+        self.seed = seed
+        # own generator, so a mock started inside the driver doesn't draw from
+        # (and perturb) the driver's seeded one
+        self.jitter_random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.accounts = {}
+        self.users = {}
+        self.images = {}
+        self.subscriptions = {}
+        self.registries = {}
+        self.archives = {}
+        self.generated = {}
+        self.feeds = self._make_feeds()
+        self._add_account(admin_user, "admin@example.com", "admin")
+        self._add_user(admin_user, admin_user, admin_password)
+        self.routes = [
+            ("GET", r"/swagger.json", self.swagger, False),
+            ("GET", r"", self.base_routes, False),
+            ("GET", r"/system", self.system_status, True),
+            ("GET", r"/system/error_codes", self.error_codes, True),
+            ("GET", r"/system/feeds", self.feeds_list, True),
+            ("PUT", r"/system/feeds/([^/]+)", self.feed_toggle, True),
+            ("PUT", r"/system/feeds/([^/]+)/([^/]+)", self.group_toggle, True),
+            ("DELETE", r"/system/feeds/([^/]+)", self.feed_delete, True),
+            ("DELETE", r"/system/feeds/([^/]+)/([^/]+)", self.group_delete, True),
+            ("GET", r"/account", self.account_self, True),
+            ("GET", r"/user", self.user_self, True),
+            ("GET", r"/accounts", self.account_list, True),
+            ("POST", r"/accounts", self.account_add, True),
+            ("GET", r"/accounts/([^/]+)", self.account_get, True),
+            ("DELETE", r"/accounts/([^/]+)", self.account_del, True),
+            ("PUT", r"/accounts/([^/]+)/state", self.account_state, True),
+            ("GET", r"/accounts/([^/]+)/users", self.user_list, True),
+            ("POST", r"/accounts/([^/]+)/users", self.user_add, True),
+            ("GET", r"/accounts/([^/]+)/users/([^/]+)", self.user_get, True),
+            ("DELETE", r"/accounts/([^/]+)/users/([^/]+)", self.user_del, True),
+            (
+                "POST",
+                r"/accounts/([^/]+)/users/([^/]+)/credentials",
+                self.user_credentials,
+                True,
+            ),
+            ("GET", r"/images", self.image_list, True),
+            ("POST", r"/images", self.image_add, True),
+            ("GET", r"/images/(sha256:[0-9a-f]+)", self.image_get, True),
+            ("DELETE", r"/images/(sha256:[0-9a-f]+)", self.image_del, True),
+            ("GET", r"/images/(sha256:[0-9a-f]+)/check", self.image_check, True),
+            (
+                "GET",
+                r"/images/(sha256:[0-9a-f]+)/(content|metadata|vuln)",
+                self.image_query_types,
+                True,
+            ),
+            (
+                "GET",
+                r"/images/(sha256:[0-9a-f]+)/(content|metadata|vuln)/([^/]+)",
+                self.image_query,
+                True,
+            ),
+            ("GET", r"/archives/images", self.archive_list, True),
+            ("POST", r"/archives/images", self.archive_add, True),
+            ("DELETE", r"/archives/images/(sha256:[0-9a-f]+)", self.archive_del, True),
+            ("POST", r"/repositories", self.repo_add, True),
+            ("GET", r"/subscriptions", self.subscription_list, True),
+            ("PUT", r"/subscriptions/([0-9a-f]+)", self.subscription_update, True),
+            ("DELETE", r"/subscriptions/([0-9a-f]+)", self.subscription_del, True),
+            ("GET", r"/registries", self.registry_list, True),
+            ("POST", r"/registries", self.registry_add, True),
+            ("GET", r"/registries/([^/]+)", self.registry_get, True),
+            ("DELETE", r"/registries/([^/]+)", self.registry_del, True),
+            ("GET", r"/events", self.event_list, True),
+        ]
+
+    # request handling
+
+    def handle(self, method, path, query, body, authorization):
+        """Return (status, payload) for one request; payload None means no body."""
+        delay = self.latency + self.jitter_random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        path = re.sub(r"^/v1", "", path.rstrip("/"))
+        params = dict((key, values[-1]) for key, values in query.items())
+        for route_method, pattern, handler, needs_auth in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method != method or not match:
+                continue
+            try:
+                caller = self.authenticate(authorization) if needs_auth else None
+                if caller is None and needs_auth:
+                    return 401, "Unauthorized"
+                args = [unquote(group) for group in match.groups()]
+                with self.lock:
+                    return 200, handler(caller, params, body, *args)
+            except MockApiError as e:
+                return e.httpcode, e.payload()
+        return 404, {"httpcode": 404, "message": "Not Found", "detail": {}}
+
+    def authenticate(self, authorization):
+        if not authorization or not authorization.startswith("Basic "):
+            return None
+        try:
+            token = base64.b64decode(authorization[6:]).decode("utf-8")
+        except ValueError:
+            return None
+        username, _, password = token.partition(":")
+        with self.lock:
+            user = self.users.get(username)
+            if not user or user["password"] != password:
+                return None
+            if self.accounts[user["account"]]["state"] != "enabled":
+                return None
+            return user
+
+    def require_admin(self, caller):
+        if self.accounts[caller["account"]]["type"] != "admin":
+            raise MockApiError(
+                403,
+                "Not authorized. Requires permissions: domain=system "
+                "action=listAccounts target=",
+            )
+
+    def account_of(self, caller, name):
+        """The account a caller may act on: its own, or any for an admin."""
+        if name != caller["account"]:
+            self.require_admin(caller)
+        if name not in self.accounts:
+            raise MockApiError(404, "Account not found")
+        return self.accounts[name]
+
+    # system
+
+    def swagger(self, caller, params, body):
+        return {
+            "swagger": "2.0",
+            "info": {"title": "Anchore Engine", "version": "0.9.4"},
+        }
+
+    def base_routes(self, caller, params, body):
+        return ["v1"]
+
+    def system_status(self, caller, params, body):
+        states = []
+        for service in SERVICES:
+            states.append(
+                {
+                    "base_url": "http://mock-{0}:8228".format(service),
+                    "hostid": "mock-{0}".format(service),
+                    "servicename": service,
+                    "service_detail": {
+                        "available": True,
+                        "busy": False,
+                        "db_version": "0.0.15",
+                        "message": "all good",
+                        "up": True,
+                        "version": "0.9.4",
+                    },
+                    "status": True,
+                    "status_message": "available",
+                    "version": "0.9.4",
+                }
+            )
+        return {"service_states": states}
+
+    def error_codes(self, caller, params, body):
+        return [
+            {"name": name, "description": "mock description of {0}".format(name)}
+            for name in ERROR_CODES
+        ]
+
+    def _make_feeds(self):
+        timestamp = now()
+        rng = random.Random(self.seed)
+        feeds = []
+        for name, groups in FEEDS.items():
+            feeds.append(
+                {
+                    "name": name,
+                    "enabled": True,
+                    "created_at": timestamp,
+                    "updated_at": timestamp,
+                    "last_full_sync": timestamp,
+                    "groups": [
+                        {
+                            "name": group,
+                            "enabled": True,
+                            "created_at": timestamp,
+                            "updated_at": timestamp,
+                            "last_sync": timestamp,
+                            "record_count": rng.randint(1000, 50000),
+                        }
+                        for group in groups
+                    ],
+                }
+            )
+        return feeds
+
+    def _feed(self, name):
+        for feed in self.feeds:
+            if feed["name"] == name:
+                return feed
+        raise MockApiError(404, "feed {0} not found".format(name))
+
+    def _group(self, feed, name):
+        for group in feed["groups"]:
+            if group["name"] == name:
+                return group
+        raise MockApiError(404, "group {0} not found".format(name))
+
+    def feeds_list(self, caller, params, body):
+        return self.feeds
+
+    def feed_toggle(self, caller, params, body, feed_name):
+        feed = self._feed(feed_name)
+        feed["enabled"] = params.get("enabled", "true").lower() == "true"
+        return [feed]
+
+    def group_toggle(self, caller, params, body, feed_name, group_name):
+        group = self._group(self._feed(feed_name), group_name)
+        group["enabled"] = params.get("enabled", "true").lower() == "true"
+        return [group]
+
+    def feed_delete(self, caller, params, body, feed_name):
+        feed = self._feed(feed_name)
+        self.feeds.remove(feed)
+        feed["enabled"] = False
+        return [feed]
+
+    def group_delete(self, caller, params, body, feed_name, group_name):
+        feed = self._feed(feed_name)
+        group = self._group(feed, group_name)
+        if group["enabled"]:
+            raise MockApiError(400, "cannot delete an enabled feed group")
+        feed["groups"].remove(group)
+        group["record_count"] = 0
+        return [group]
+
+    # accounts and users
+
+    def _add_account(self, name, email, account_type="user"):
+        timestamp = now()
+        self.accounts[name] = {
+            "name": name,
+            "email": email,
+            "type": account_type,
+            "state": "enabled",
+            "created_at": timestamp,
+            "last_updated": timestamp,
+        }
+        return self.accounts[name]
+
+    def _add_user(self, account, username, password):
+        timestamp = now()
+        self.users[username] = {
+            "username": username,
+            "password": password,
+            "account": account,
+            "type": "native",
+            "source": None,
+            "created_at": timestamp,
+            "last_updated": timestamp,
+        }
+        return self._user_record(self.users[username])
+
+    def _user_record(self, user):
+        return dict((k, v) for k, v in user.items() if k not in ["password", "account"])
+
+    def account_self(self, caller, params, body):
+        return self.accounts[caller["account"]]
+
+    def user_self(self, caller, params, body):
+        return self._user_record(caller)
+
+    def account_list(self, caller, params, body):
+        self.require_admin(caller)
+        return list(self.accounts.values())
+
+    def account_add(self, caller, params, body):
+        self.require_admin(caller)
+        name = (body or {}).get("name")
+        if not name:
+            raise MockApiError(400, "account name is required")
+        if name in self.accounts:
+            raise MockApiError(409, "Account already exists")
+        return self._add_account(name, body.get("email"))
+
+    def account_get(self, caller, params, body, name):
+        return self.account_of(caller, name)
+
+    def account_state(self, caller, params, body, name):
+        account = self.account_of(caller, name)
+        state = (body or {}).get("state")
+        if state not in ["enabled", "disabled"] or account["state"] == "deleting":
+            raise MockApiError(
+                400,
+                "Invalid account state change requested. Cannot go from state "
+                "{0} to state {1}".format(account["state"], state),
+            )
+        account["state"] = state
+        account["last_updated"] = now()
+        return {"state": state}
+
+    def account_del(self, caller, params, body, name):
+        account = self.account_of(caller, name)
+        if account["state"] != "disabled":
+            raise MockApiError(
+                400,
+                "Invalid account state change requested. Cannot go from state "
+                "{0} to state deleting".format(account["state"]),
+            )
+        account["state"] = "deleting"
+        account["last_updated"] = now()
+        return account
+
+    def user_list(self, caller, params, body, account):
+        self.account_of(caller, account)
+        return [
+            self._user_record(user)
+            for user in self.users.values()
+            if user["account"] == account
+        ]
+
+    def user_add(self, caller, params, body, account):
+        self.require_admin(caller)
+        self.account_of(caller, account)
+        username = (body or {}).get("username")
+        if not username or not body.get("password"):
+            raise MockApiError(400, "username and password are required")
+        if username in self.users:
+            raise MockApiError(409, "User already exists")
+        return self._add_user(account, username, body["password"])
+
+    def _user(self, caller, account, username):
+        self.account_of(caller, account)
+        user = self.users.get(username)
+        if not user or user["account"] != account:
+            raise MockApiError(404, "User not found")
+        return user
+
+    def user_get(self, caller, params, body, account, username):
+        return self._user_record(self._user(caller, account, username))
+
+    def user_del(self, caller, params, body, account, username):
+        self._user(caller, account, username)
+        del self.users[username]
+        return None
+
+    def user_credentials(self, caller, params, body, account, username):
+        user = self._user(caller, account, username)
+        user["password"] = (body or {}).get("value", user["password"])
+        user["last_updated"] = now()
+        return self._user_record(user)
+
+    # images
+
+    def _account_images(self, caller):
+        return self.images.setdefault(caller["account"], {})
+
+    def _schedule_analysis(self):
+        """When an image added now starts being analyzed and when it is done."""
+        added = time.time()
+        if not self.analyzers:
+            return added + self.analysis_time / 3, added + self.analysis_time
+        started = max(added, heapq.heappop(self.analyzers_free))
+        heapq.heappush(self.analyzers_free, started + self.analysis_time)
+        return started, started + self.analysis_time
+
+    def _analysis_status(self, image):
+        started, done = image["analysis_window"]
+        current = time.time()
+        if current >= done:
+            return "analyzed"
+        if current >= started:
+            return "analyzing"
+        return "not_analyzed"
+
+    def _image_record(self, caller, image):
+        status = self._analysis_status(image)
+        record = dict((k, v) for k, v in image.items() if k not in ["analysis_window"])
+        record["analysis_status"] = status
+        record["analyzed_at"] = image["created_at"] if status == "analyzed" else None
+        record["userId"] = caller["account"]
+        return record
+
+    def _image(self, caller, digest):
+        image = self._account_images(caller).get(digest)
+        if not image:
+            raise MockApiError(404, "image data not found in DB")
+        return image
+
+    def _analyzed(self, caller, digest):
+        image = self._image(caller, digest)
+        status = self._analysis_status(image)
+        if status != "analyzed":
+            raise MockApiError(
+                404, "image is not analyzed - analysis_status: {0}".format(status)
+            )
+        return image
+
+    def image_list(self, caller, params, body):
+        images = self._account_images(caller).values()
+        if params.get("fulltag"):
+            tag = fulltag(params["fulltag"])
+            images = [
+                image
+                for image in images
+                if tag in [detail["fulltag"] for detail in image["image_detail"]]
+            ]
+            if not images:
+                raise MockApiError(404, "image data not found in DB")
+        return [self._image_record(caller, image) for image in images]
+
+    def image_add(self, caller, params, body):
+        tag = (body or {}).get("tag")
+        if not tag:
+            raise MockApiError(400, "tag or digest is required")
+        registry, repo, version = parse_image_ref(tag)
+        full = "{0}/{1}:{2}".format(registry, repo, version)
+        digest = "sha256:" + hashlib.sha256(full.encode("utf-8")).hexdigest()
+        images = self._account_images(caller)
+        if digest not in images:
+            timestamp = now()
+            rng = self._rng(digest, "image")
+            images[digest] = {
+                "analysis_window": self._schedule_analysis(),
+                "annotations": {},
+                "created_at": timestamp,
+                "imageDigest": digest,
+                "image_status": "active",
+                "image_type": "docker",
+                "last_updated": timestamp,
+                "parentDigest": digest,
+                "image_content": {
+                    "metadata": {
+                        "arch": "amd64",
+                        "distro": repo.split("/")[-1],
+                        "distro_version": version,
+                        "dockerfile_mode": "Guessed",
+                        "image_size": rng.randint(5, 500) * 1000000,
+                        "layer_count": rng.randint(1, 12),
+                    }
+                },
+                "image_detail": [
+                    {
+                        "created_at": timestamp,
+                        "digest": digest,
+                        "dockerfile": None,
+                        "fulldigest": "{0}/{1}@{2}".format(registry, repo, digest),
+                        "fulltag": full,
+                        "imageDigest": digest,
+                        "imageId": hashlib.sha256(digest.encode()).hexdigest(),
+                        "last_updated": timestamp,
+                        "registry": registry,
+                        "repo": repo,
+                        "tag": version,
+                        "tag_detected_at": timestamp,
+                        "userId": caller["account"],
+                    }
+                ],
+            }
+            if params.get("autosubscribe", "True").lower() == "true":
+                for sub_type in ["tag_update", "policy_eval", "vuln_update"]:
+                    self._subscribe(caller, sub_type, full, sub_type == "tag_update")
+        return [self._image_record(caller, images[digest])]
+
+    def image_get(self, caller, params, body, digest):
+        return [self._image_record(caller, self._image(caller, digest))]
+
+    def image_del(self, caller, params, body, digest):
+        image = self._image(caller, digest)
+        tags = [detail["fulltag"] for detail in image["image_detail"]]
+        watched = [
+            sub
+            for sub in self.subscriptions.get(caller["account"], [])
+            if sub["subscription_type"] == "tag_update"
+            and sub["subscription_key"] in tags
+            and sub["active"]
+        ]
+        if watched and params.get("force", "false").lower() != "true":
+            raise MockApiError(
+                409,
+                "cannot delete image that is the latest of its tags, and has "
+                "active subscription",
+            )
+        del self._account_images(caller)[digest]
+        return {"detail": None, "digest": digest, "status": "deleting"}
+
+    def image_check(self, caller, params, body, digest):
+        image = self._analyzed(caller, digest)
+        tag = params.get("tag") or image["image_detail"][0]["fulltag"]
+        return [
+            {
+                digest: {
+                    tag: [
+                        {
+                            "detail": {},
+                            "last_evaluation": now(),
+                            "policyId": DEFAULT_POLICY_ID,
+                            "status": "pass",
+                        }
+                    ]
+                }
+            }
+        ]
+
+    def image_query_types(self, caller, params, body, digest, group):
+        self._analyzed(caller, digest)
+        return {
+            "content": CONTENT_TYPES,
+            "metadata": METADATA_TYPES,
+            "vuln": VULNERABILITY_TYPES,
+        }[group]
+
+    def image_query(self, caller, params, body, digest, group, query_type):
+        image = self._analyzed(caller, digest)
+        if group == "content":
+            if query_type not in CONTENT_TYPES:
+                raise MockApiError(404, "content type {0} not found".format(query_type))
+            return {
+                "content": self._content(image, query_type),
+                "content_type": query_type,
+                "imageDigest": digest,
+            }
+        if group == "metadata":
+            if query_type not in METADATA_TYPES:
+                raise MockApiError(
+                    404, "metadata type {0} not found".format(query_type)
+                )
+            return {
+                "imageDigest": digest,
+                "metadata": self._metadata(image, query_type),
+                "metadata_type": query_type,
+            }
+        if query_type not in VULNERABILITY_TYPES:
+            raise MockApiError(
+                404, "vulnerability type {0} not found".format(query_type)
+            )
+        return {
+            "imageDigest": digest,
+            "vulnerabilities": self._vulnerabilities(image, query_type),
+            "vulnerability_type": query_type,
+        }
+
+    # generated image data
+
+    def _rng(self, digest, kind):
+        return random.Random("{0}:{1}:{2}".format(self.seed, digest, kind))
+
+    def _generate(self, image, kind, build):
+        """Build generated data once per image and kind."""
+        key = (image["imageDigest"], kind)
+        if key not in self.generated:
+            self.generated[key] = build(self._rng(image["imageDigest"], kind))
+        return self.generated[key]
+
+    def _content(self, image, content_type):
+        def build(rng):
+            if content_type == "malware":
+                findings = []
+                if "malware" in image["image_detail"][0]["fulltag"]:
+                    findings.append(
+                        {
+                            "path": "/elf_payload1",
+                            "signature": "Unix.Trojan.MSShellcode-40",
+                        }
+                    )
+                return [
+                    {
+                        "enabled": True,
+                        "findings": findings,
+                        "metadata": {"db_version": {"daily": "26000", "main": "59"}},
+                        "scanner": "clamav",
+                    }
+                ]
+            if content_type == "files":
+                return [
+                    {
+                        "filename": "/usr/lib/file{0}".format(index),
+                        "gid": 0,
+                        "linkdest": None,
+                        "mode": 33188,
+                        "sha256": hashlib.sha256(str(index).encode()).hexdigest(),
+                        "size": rng.randint(100, 100000),
+                        "type": "file",
+                        "uid": 0,
+                    }
+                    for index in range(self.packages * 2)
+                ]
+            count = self.packages if content_type == "os" else self.packages // 10
+            return [
+                {
+                    "license": rng.choice(["MIT", "GPL-2.0", "Apache-2.0", "BSD"]),
+                    "location": "/usr/lib/{0}/pkg{1}".format(content_type, index),
+                    "origin": "mock",
+                    "package": "{0}-pkg{1}".format(content_type, index),
+                    "size": str(rng.randint(1000, 1000000)),
+                    "type": content_type.upper(),
+                    "version": "{0}.{1}.{2}".format(
+                        rng.randint(0, 5), rng.randint(0, 20), rng.randint(0, 9)
+                    ),
+                }
+                for index in range(count)
+            ]
+
+        return self._generate(image, "content:" + content_type, build)
+
+    def _metadata(self, image, metadata_type):
+        def build(rng):
+            if metadata_type == "manifest":
+                document = {
+                    "schemaVersion": 2,
+                    "layers": [
+                        {"digest": "sha256:{0:064x}".format(rng.getrandbits(256))}
+                        for _ in range(
+                            image["image_content"]["metadata"]["layer_count"]
+                        )
+                    ],
+                }
+            elif metadata_type == "docker_history":
+                document = [
+                    {"Created": image["created_at"], "CreatedBy": "/bin/sh -c #(nop)"}
+                ]
+            else:
+                document = "FROM scratch\n"
+            if not isinstance(document, str):
+                document = json.dumps(document)
+            return base64.b64encode(document.encode("utf-8")).decode("ascii")
+
+        return self._generate(image, "metadata:" + metadata_type, build)
+
+    def _vulnerabilities(self, image, vulnerability_type):
+        def build(rng):
+            vulnerabilities = []
+            os_count = self.vulnerabilities * 2 // 3
+            for index in range(self.vulnerabilities):
+                is_os = index < os_count
+                package = "{0}-pkg{1}".format("os" if is_os else "python", index)
+                vulnerabilities.append(
+                    {
+                        "feed": "vulnerabilities" if is_os else "github",
+                        "feed_group": rng.choice(FEEDS["vulnerabilities"])
+                        if is_os
+                        else "github:python",
+                        "fix": rng.choice(["None", "1.{0}.1".format(index)]),
+                        "nvd_data": [],
+                        "package": "{0}-1.{1}.0".format(package, index),
+                        "package_cpe": "None",
+                        "package_name": package,
+                        "package_path": "pkgdb" if is_os else "/usr/lib/python3",
+                        "package_type": "APKG" if is_os else "python",
+                        "package_version": "1.{0}.0".format(index),
+                        "severity": rng.choice(SEVERITIES),
+                        "url": "https://nvd.nist.gov/vuln/detail/CVE-2020-{0:05d}".format(
+                            index
+                        ),
+                        "vendor_data": [],
+                        "vuln": "CVE-2020-{0:05d}".format(index),
+                    }
+                )
+            return vulnerabilities
+
+        everything = self._generate(image, "vuln", build)
+        if vulnerability_type == "os":
+            return [v for v in everything if v["package_type"] != "python"]
+        if vulnerability_type == "non-os":
+            return [v for v in everything if v["package_type"] == "python"]
+        return everything
+
+    # analysis archive
+
+    def archive_list(self, caller, params, body):
+        return list(self.archives.get(caller["account"], {}).values())
+
+    def archive_add(self, caller, params, body):
+        archive = self.archives.setdefault(caller["account"], {})
+        results = []
+        for digest in body or []:
+            image = self._analyzed(caller, digest)
+            archive[digest] = {
+                "analyzed_at": image["created_at"],
+                "created_at": now(),
+                "imageDigest": digest,
+                "image_detail": image["image_detail"],
+                "status": "archived",
+            }
+            results.append(
+                {
+                    "detail": "Completed successfully",
+                    "digest": digest,
+                    "status": "archived",
+                }
+            )
+        return results
+
+    def archive_del(self, caller, params, body, digest):
+        archive = self.archives.setdefault(caller["account"], {})
+        if digest not in archive:
+            raise MockApiError(404, "Archived analysis not found")
+        del archive[digest]
+        return None
+
+    # subscriptions and repositories
+
+    def _subscribe(self, caller, sub_type, key, active, value=None):
+        subscriptions = self.subscriptions.setdefault(caller["account"], [])
+        for sub in subscriptions:
+            if sub["subscription_type"] == sub_type and sub["subscription_key"] == key:
+                return sub
+        timestamp = now()
+        sub = {
+            "active": active,
+            "created_at": timestamp,
+            "last_updated": timestamp,
+            "subscription_id": uuid.uuid4().hex,
+            "subscription_key": key,
+            "subscription_type": sub_type,
+            "subscription_value": value,
+            "userId": caller["account"],
+        }
+        subscriptions.append(sub)
+        return sub
+
+    def _subscription(self, caller, sub_id):
+        for sub in self.subscriptions.get(caller["account"], []):
+            if sub["subscription_id"] == sub_id:
+                return sub
+        raise MockApiError(404, "subscription not found")
+
+    def repo_add(self, caller, params, body):
+        repo = params.get("repository")
+        if not repo:
+            raise MockApiError(400, "repository is required")
+        value = json.dumps(
+            {
+                "autosubscribe": params.get("autosubscribe", "False").lower() == "true",
+                "lookuptag": params.get("lookuptag") or "latest",
+            }
+        )
+        return [self._subscribe(caller, "repo_update", repo, True, value)]
+
+    def subscription_list(self, caller, params, body):
+        return [
+            sub
+            for sub in self.subscriptions.get(caller["account"], [])
+            if sub["subscription_type"]
+            == params.get("subscription_type", sub["subscription_type"])
+            and sub["subscription_key"]
+            == params.get("subscription_key", sub["subscription_key"])
+        ]
+
+    def subscription_update(self, caller, params, body, sub_id):
+        sub = self._subscription(caller, sub_id)
+        if "active" in (body or {}):
+            sub["active"] = bool(body["active"])
+        sub["last_updated"] = now()
+        return [sub]
+
+    def subscription_del(self, caller, params, body, sub_id):
+        sub = self._subscription(caller, sub_id)
+        self.subscriptions[caller["account"]].remove(sub)
+        return True
+
+    # registries
+
+    def _account_registries(self, caller):
+        return self.registries.setdefault(caller["account"], {})
+
+    def registry_list(self, caller, params, body):
+        return list(self._account_registries(caller).values())
+
+    def registry_add(self, caller, params, body):
+        body = body or {}
+        registries = self._account_registries(caller)
+        if body.get("registry") in registries:
+            raise MockApiError(409, "registry already exists in DB")
+        timestamp = now()
+        registries[body["registry"]] = {
+            "created_at": timestamp,
+            "last_upated": timestamp,
+            "registry": body["registry"],
+            "registry_name": body.get("registry_name") or body["registry"],
+            "registry_type": body.get("registry_type", "docker_v2"),
+            "registry_user": body.get("registry_user"),
+            "registry_verify": body.get("registry_verify", True),
+            "userId": caller["account"],
+        }
+        return [registries[body["registry"]]]
+
+    def registry_get(self, caller, params, body, registry):
+        registries = self._account_registries(caller)
+        if registry not in registries:
+            raise MockApiError(404, "registry not found")
+        return [registries[registry]]
+
+    def registry_del(self, caller, params, body, registry):
+        registries = self._account_registries(caller)
+        if registry not in registries:
+            raise MockApiError(404, "registry not found")
+        del registries[registry]
+        return True
+
+    def event_list(self, caller, params, body):
+        return {"item_count": 0, "next_page": False, "page": 1, "results": []}
+
+
+class MockEngineHandler(http.server.BaseHTTPRequestHandler):
+    """Hand every request to the server's MockEngine; keeps connections alive."""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes; don't let Nagle's algorithm
+    # hold the body back waiting for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def _respond(self, method):
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = None
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length).decode("utf-8"))
+            except ValueError:
+                body = None
+        status, payload = self.server.engine.handle(
+            method,
+            parts.path,
+            parse_qs(parts.query),
+            body,
+            self.headers.get("Authorization"),
+        )
+        if payload is None:
+            data = b""
+        else:
+            data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def do_PUT(self):
+        self._respond("PUT")
+
+    def do_DELETE(self):
+        self._respond("DELETE")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockEngineServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, engine):
+        super().__init__(address, MockEngineHandler)
+        self.engine = engine
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://{0}:{1}/v1".format(host, port)
+
+
+def serve(host="127.0.0.1", port=0, **settings):
+    """Start a mock engine on a background thread; returns the server, whose
+    url is the API base url to point the driver at. Stop it with shutdown()."""
+    server = MockEngineServer((host, port), MockEngine(**settings))
+    thread = threading.Thread(
+        target=server.serve_forever, name="mock-engine", daemon=True
+    )
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Anchore Engine API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8228)
+    parser.add_argument("--admin-user", default="admin")
+    parser.add_argument("--admin-password", default="foobar")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every request"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="random extra latency, up to seconds"
+    )
+    parser.add_argument(
+        "--analysis-time",
+        type=float,
+        default=1.0,
+        help="seconds an added image takes to be analyzed",
+    )
+    parser.add_argument(
+        "--analyzers",
+        type=int,
+        default=0,
+        help="images analyzed at once, the rest queue (default: no limit)",
+    )
+    parser.add_argument(
+        "--packages", type=int, default=100, help="os packages per image"
+    )
+    parser.add_argument(
+        "--vulnerabilities", type=int, default=50, help="vulnerabilities per image"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = MockEngineServer(
+        (args.host, args.port),
+        MockEngine(
+            admin_user=args.admin_user,
+            admin_password=args.admin_password,
+            latency=args.latency,
+            jitter=args.jitter,
+            analysis_time=args.analysis_time,
+            analyzers=args.analyzers,
+            packages=args.packages,
+            vulnerabilities=args.vulnerabilities,
+            seed=args.seed,
+        ),
+    )
+    print("mock engine listening on {0}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()